@@ -0,0 +1,49 @@
+"""answers.answer_hash and answer fingerprints
+
+Revision ID: 0001_answer_hash
+Revises:
+Create Date: 2026-10-17 10:00:00
+
+Базы, созданные до появления отпечатков ответов. Миграция пропускает то, что
+уже есть: новая база создается целиком через Base.metadata.create_all.
+Хэши старых ответов заполняет scripts/backfill_answer_fingerprints.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0001_answer_hash"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "answers" in tables:
+        if "answer_hash" not in {column["name"] for column in inspector.get_columns("answers")}:
+            op.add_column("answers", sa.Column("answer_hash", sa.String(length=64), nullable=True))
+        if "ix_answers_question_id_answer_hash" not in {index["name"] for index in inspector.get_indexes("answers")}:
+            op.create_index("ix_answers_question_id_answer_hash", "answers", ["question_id", "answer_hash"])
+
+    if "answer_fingerprints" not in tables:
+        op.create_table(
+            "answer_fingerprints",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("question_id", sa.Integer(), sa.ForeignKey("questions.id"), nullable=False),
+            sa.Column("answer_hash", sa.String(length=64), nullable=False),
+            sa.Column("answer_count", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("question_id", "answer_hash", name="uq_answer_fingerprints_question_hash")
+        )
+        op.create_index("ix_answer_fingerprints_id", "answer_fingerprints", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("answer_fingerprints")
+    op.drop_index("ix_answers_question_id_answer_hash", table_name="answers")
+    op.drop_column("answers", "answer_hash")
@@ -0,0 +1,35 @@
+"""test_results.analysis_status
+
+Revision ID: 0002_analysis_status
+Revises: 0001_answer_hash
+Create Date: 2026-10-17 10:10:00
+
+Результаты, сохраненные до фонового анализа, уже проверены синхронно -
+для них статус done. Таблица analysis_jobs создается при запуске приложения
+(Base.metadata.create_all).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0002_analysis_status"
+down_revision: Union[str, None] = "0001_answer_hash"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if "test_results" not in inspector.get_table_names():
+        return
+    if "analysis_status" in {column["name"] for column in inspector.get_columns("test_results")}:
+        return
+
+    op.add_column("test_results", sa.Column("analysis_status", sa.String(length=20), nullable=True))
+    op.execute("UPDATE test_results SET analysis_status = 'done' WHERE analysis_status IS NULL")
+
+
+def downgrade() -> None:
+    op.drop_column("test_results", "analysis_status")
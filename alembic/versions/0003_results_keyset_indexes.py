@@ -0,0 +1,38 @@
+"""test_results keyset pagination indexes
+
+Revision ID: 0003_results_keyset_indexes
+Revises: 0002_analysis_status
+Create Date: 2026-10-17 10:20:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0003_results_keyset_indexes"
+down_revision: Union[str, None] = "0002_analysis_status"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_test_results_created_at_id": ["created_at", "id"],
+    "ix_test_results_test_id_created_at": ["test_id", "created_at", "id"],
+    "ix_test_results_is_suspicious_created_at": ["is_suspicious", "created_at", "id"],
+}
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if "test_results" not in inspector.get_table_names():
+        return
+    existing = {index["name"] for index in inspector.get_indexes("test_results")}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "test_results", columns)
+
+
+def downgrade() -> None:
+    for name in INDEXES:
+        op.drop_index(name, table_name="test_results")
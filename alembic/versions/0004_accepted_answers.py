@@ -0,0 +1,37 @@
+"""questions.accepted_answers and answer hashes in the grading normal form
+
+Revision ID: 0004_accepted_answers
+Revises: 0003_results_keyset_indexes
+Create Date: 2026-10-17 10:30:00
+
+answer_hash теперь считается от normalize_answer (как при проверке ответов),
+поэтому старые хэши сбрасываются; scripts/backfill_answer_fingerprints.py
+пересчитывает их и таблицу отпечатков.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0004_accepted_answers"
+down_revision: Union[str, None] = "0003_results_keyset_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "questions" in tables and "accepted_answers" not in {
+        column["name"] for column in inspector.get_columns("questions")
+    }:
+        op.add_column("questions", sa.Column("accepted_answers", sa.JSON(), nullable=True))
+
+    if "answers" in tables:
+        op.execute("UPDATE answers SET answer_hash = NULL WHERE answer_hash IS NOT NULL")
+
+
+def downgrade() -> None:
+    op.drop_column("questions", "accepted_answers")
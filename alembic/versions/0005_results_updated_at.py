@@ -0,0 +1,45 @@
+"""test_results.updated_at for incremental exports
+
+Revision ID: 0005_results_updated_at
+Revises: 0004_accepted_answers
+Create Date: 2026-10-17 10:40:00
+
+Существующим результатам ставится время завершения (или создания).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0005_results_updated_at"
+down_revision: Union[str, None] = "0004_accepted_answers"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if "test_results" not in inspector.get_table_names():
+        return
+
+    if "updated_at" not in {column["name"] for column in inspector.get_columns("test_results")}:
+        op.add_column("test_results", sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True))
+        op.execute(
+            "UPDATE test_results SET updated_at = COALESCE(completed_at, created_at, CURRENT_TIMESTAMP)"
+        )
+        with op.batch_alter_table("test_results") as batch:
+            batch.alter_column(
+                "updated_at",
+                existing_type=sa.DateTime(timezone=True),
+                nullable=False,
+                server_default=sa.func.now()
+            )
+
+    if "ix_test_results_updated_at_id" not in {index["name"] for index in inspector.get_indexes("test_results")}:
+        op.create_index("ix_test_results_updated_at_id", "test_results", ["updated_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_test_results_updated_at_id", table_name="test_results")
+    op.drop_column("test_results", "updated_at")
@@ -0,0 +1,39 @@
+"""tests.updated_at and questions.updated_at for export cache keys
+
+Revision ID: 0006_catalog_updated_at
+Revises: 0005_results_updated_at
+Create Date: 2026-10-17 10:50:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0006_catalog_updated_at"
+down_revision: Union[str, None] = "0005_results_updated_at"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("tests", "questions")
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    for table in TABLES:
+        if table in tables and "updated_at" not in {column["name"] for column in inspector.get_columns(table)}:
+            op.add_column(table, sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True))
+            op.execute(f"UPDATE {table} SET updated_at = created_at")
+            with op.batch_alter_table(table) as batch:
+                batch.alter_column(
+                    "updated_at",
+                    existing_type=sa.DateTime(timezone=True),
+                    server_default=sa.func.now()
+                )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, "updated_at")
@@ -0,0 +1,140 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import or_
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import AnalysisJob, TestResult
+from app.services import TestResultService
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisQueue:
+    """Очередь фонового анализа подозрительной активности.
+
+    Задания хранятся в таблице analysis_jobs и создаются в той же транзакции,
+    что и результат теста, поэтому при перезапуске ничего не теряется:
+    незавершенные задания подхватываются в start(). Задание в статусе running
+    считается брошенным, только если его не обновляли дольше lease_seconds:
+    иначе его, возможно, выполняет другой процесс.
+    """
+
+    def __init__(self, workers: int, max_attempts: int, lease_seconds: int):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = timedelta(seconds=lease_seconds)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_inline(self) -> bool:
+        """Анализ выполняется синхронно в вызывающем потоке"""
+        return self._executor is None
+
+    def start(self) -> None:
+        if self.workers <= 0:
+            return
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="analysis"
+                )
+
+        for test_result_id in self._recover_pending_jobs():
+            self.enqueue(test_result_id)
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            # Невыполненные задания остаются в базе и будут подхвачены при следующем запуске
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def enqueue(self, test_result_id: int) -> None:
+        executor = self._executor
+        if executor is None:
+            self._run_job(test_result_id)
+            return
+
+        try:
+            executor.submit(self._run_job, test_result_id)
+        except RuntimeError:
+            # Пул уже остановлен - задание останется pending до следующего запуска
+            logger.warning("Analysis queue is stopped, job for result %s left pending", test_result_id)
+
+    def _recover_pending_jobs(self):
+        db = SessionLocal()
+        try:
+            # Задания в статусе running с истекшей арендой остались от прерванного процесса;
+            # updated_at ставится при захвате задания
+            expired = datetime.now(timezone.utc) - self.lease
+            db.query(AnalysisJob).filter(
+                AnalysisJob.status == "running",
+                or_(AnalysisJob.updated_at.is_(None), AnalysisJob.updated_at < expired)
+            ).update({"status": "pending"}, synchronize_session=False)
+            db.commit()
+            return [
+                test_result_id
+                for (test_result_id,) in db.query(AnalysisJob.test_result_id).filter(
+                    AnalysisJob.status == "pending"
+                ).order_by(AnalysisJob.id)
+            ]
+        finally:
+            db.close()
+
+    def _run_job(self, test_result_id: int) -> None:
+        db = SessionLocal()
+        try:
+            # Захватываем задание, чтобы его не выполнили дважды
+            claimed = db.query(AnalysisJob).filter(
+                AnalysisJob.test_result_id == test_result_id,
+                AnalysisJob.status == "pending"
+            ).update(
+                {"status": "running", "attempts": AnalysisJob.attempts + 1},
+                synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return
+
+            job = db.query(AnalysisJob).filter(AnalysisJob.test_result_id == test_result_id).one()
+            try:
+                TestResultService.run_analysis(db, job)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self._handle_failure(db, test_result_id, e)
+        finally:
+            db.close()
+
+    def _handle_failure(self, db, test_result_id: int, error: Exception) -> None:
+        logger.exception("Analysis of result %s failed", test_result_id)
+
+        job = db.query(AnalysisJob).filter(AnalysisJob.test_result_id == test_result_id).one()
+        job.error = str(error)
+        retry = job.attempts < self.max_attempts
+        if retry:
+            job.status = "pending"
+        else:
+            job.status = "failed"
+            db.query(TestResult).filter(TestResult.id == test_result_id).update(
+                {"analysis_status": "failed"}, synchronize_session=False
+            )
+        db.commit()
+
+        if retry:
+            self.enqueue(test_result_id)
+
+
+analysis_queue = AnalysisQueue(
+    workers=settings.analysis_workers,
+    max_attempts=settings.analysis_max_attempts,
+    lease_seconds=settings.analysis_job_lease_seconds
+)
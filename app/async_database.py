@@ -0,0 +1,26 @@
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config import settings
+from app.database import PoolStats, engine_options
+
+async_pool_stats = PoolStats()
+
+# Асинхронный engine: aiosqlite локально, asyncpg для PostgreSQL
+async_engine = create_async_engine(
+    settings.database_url_async,
+    **engine_options(AsyncAdaptedQueuePool, async_pool_stats)
+)
+
+# expire_on_commit=False: после коммита атрибуты доступны без повторного запроса,
+# иначе обращение к ним вне greenlet привело бы к ошибке MissingGreenlet
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+    class_=AsyncSession
+)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,45 @@
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import CatalogEntry
+from app.models import TestResult
+from app.schemas import TestSubmission, BulkSubmissionItem
+from app.services import UserService, TestService, TestResultService
+
+
+# Асинхронные версии сервисов: бизнес-логика общая с синхронными сервисами
+# и выполняется через AsyncSession.run_sync, ввод-вывод идет через async-драйвер
+
+
+class AsyncUserService:
+    @staticmethod
+    async def get_or_create_user_id(db: AsyncSession, telegram_id: int, username: str = None,
+                                    first_name: str = None, last_name: str = None) -> int:
+        return await db.run_sync(
+            UserService.get_or_create_user_id, telegram_id, username, first_name, last_name
+        )
+
+
+class AsyncTestService:
+    @staticmethod
+    async def get_active_tests_cached(db: AsyncSession) -> CatalogEntry:
+        return await db.run_sync(TestService.get_active_tests_cached)
+    
+    @staticmethod
+    async def get_test_by_id_cached(db: AsyncSession, test_id: int) -> Optional[CatalogEntry]:
+        return await db.run_sync(TestService.get_test_by_id_cached, test_id)
+    
+    @staticmethod
+    async def get_test_questions_cached(db: AsyncSession, test_id: int) -> CatalogEntry:
+        return await db.run_sync(TestService.get_test_questions_cached, test_id)
+
+
+class AsyncTestResultService:
+    @staticmethod
+    async def submit_test(db: AsyncSession, test_submission: TestSubmission, user_id: int) -> TestResult:
+        return await db.run_sync(TestResultService.submit_test, test_submission, user_id)
+    
+    @staticmethod
+    async def submit_bulk(db: AsyncSession, items: List[BulkSubmissionItem]) -> List[Dict[str, Any]]:
+        return await db.run_sync(TestResultService.submit_bulk, items)
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Test, Question
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogEntry:
+    __slots__ = ("body", "etag", "version", "loaded_at")
+
+    def __init__(self, body: bytes, version: int):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Проверка заголовка If-None-Match (список ETag или *)"""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == "*" or tag == self.etag:
+                return True
+        return False
+
+
+class CatalogCache:
+    """Кэш сериализованного каталога тестов и вопросов в памяти процесса.
+
+    Версия увеличивается при любой записи в tests/questions через ORM этого
+    процесса; TTL ограничивает устаревание данных, записанных другими процессами.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Hashable, CatalogEntry] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[bytes]]) -> Optional[CatalogEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl_seconds:
+            return entry
+
+        version = self._version
+        body = loader()
+        if body is None:
+            return None
+
+        entry = CatalogEntry(body, version)
+        with self._lock:
+            # Не кэшируем данные, прочитанные до инвалидации
+            if self._version == version:
+                self._entries[key] = entry
+        return entry
+
+
+class IdentityCache:
+    """Ограниченный LRU-кэш telegram_id -> (user_id, username, first_name, last_name).
+
+    Заполняется только после коммита upsert, поэтому хранит лишь существующих
+    пользователей; имена нужны, чтобы заметить их изменение без запроса к базе.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[int, Optional[str], Optional[str], Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, telegram_id: int) -> Optional[Tuple[int, Optional[str], Optional[str], Optional[str]]]:
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is not None:
+                self._entries.move_to_end(telegram_id)
+            return entry
+
+    def put(self, telegram_id: int, entry: Tuple[int, Optional[str], Optional[str], Optional[str]]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[telegram_id] = entry
+            self._entries.move_to_end(telegram_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class ExportCache:
+    """LRU-кэш готовых выгрузок, ограниченный суммарным размером в байтах.
+
+    Ключ включает отпечаток выгружаемых данных, поэтому записи не нужно
+    инвалидировать: после новых отправок ключ меняется, а старые записи
+    вытесняются. Выгрузки больше четверти лимита не кэшируются. С disk_dir
+    записи дублируются на диск (с тем же лимитом) и переживают перезапуск.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4
+        self.disk_dir = disk_dir or None
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        raw = json.dumps(parts, default=str, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+
+        body = self._read_disk(key)
+        if body is not None:
+            self._remember(key, body)
+        return body
+
+    def put(self, key: str, body: bytes) -> None:
+        if len(body) > self.max_entry_bytes:
+            return
+        self._remember(key, body)
+        self._write_disk(key, body)
+
+    def tee(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Отдает фрагменты потоковой выгрузки дальше и кэширует ее, если она дошла
+        до конца и уместилась в лимит записи"""
+        collected = []
+        size = 0
+        for chunk in chunks:
+            if collected is not None:
+                size += len(chunk)
+                if size > self.max_entry_bytes:
+                    collected = None
+                else:
+                    collected.append(chunk)
+            yield chunk
+        if collected is not None:
+            self.put(key, b"".join(collected))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remember(self, key: str, body: bytes) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.export")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as cached:
+                body = cached.read()
+        except FileNotFoundError:
+            return None
+        # Отметка использования для вытеснения на диске
+        os.utime(self._disk_path(key))
+        return body
+
+    def _write_disk(self, key: str, body: bytes) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            with open(path + ".tmp", "wb") as cached:
+                cached.write(body)
+            os.replace(path + ".tmp", path)
+            self._prune_disk()
+        except OSError:
+            # Диск - лишь второй уровень кэша, ошибка записи не должна ломать выгрузку
+            logger.warning("Failed to persist export cache entry %s", key, exc_info=True)
+
+    def _prune_disk(self) -> None:
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".export"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+catalog_cache = CatalogCache(ttl_seconds=settings.catalog_cache_ttl_seconds)
+identity_cache = IdentityCache(max_size=settings.user_cache_size)
+export_cache = ExportCache(max_bytes=settings.export_cache_max_bytes, disk_dir=settings.export_cache_dir)
+
+_CATALOG_MODELS = (Test, Question)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_catalog_changes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _CATALOG_MODELS):
+            session.info["catalog_changed"] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_catalog_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, _CATALOG_MODELS):
+        orm_execute_state.session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_catalog(session):
+    if session.info.pop("catalog_changed", False):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_catalog_changes(session):
+    session.info.pop("catalog_changed", None)
@@ -7,6 +7,13 @@ class Settings(BaseSettings):
     # Database - Heroku автоматически предоставляет DATABASE_URL
     database_url: str = "sqlite:///./quantum_insight.db"
     
+    # Пул соединений (на процесс, отдельно для sync и async engine)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800  # секунды; меньше idle-таймаута Heroku Postgres
+    db_pool_pre_ping: bool = True
+    
     # Security
     secret_key: str = "your-super-secret-key-change-this-in-production"
     algorithm: str = "HS256"
@@ -20,6 +27,59 @@ class Settings(BaseSettings):
     allowed_hosts: str = "localhost,127.0.0.1"
     cors_origins: str = "http://localhost:3000,http://localhost:5173,https://web.telegram.org"
     
+    # Кэш каталога тестов и вопросов (секунды)
+    catalog_cache_ttl_seconds: int = 300
+    
+    # Кэш telegram_id -> user_id (число пользователей)
+    user_cache_size: int = 10000
+    
+    # Перестроение распределения баллов для перцентиля (секунды)
+    ranking_refresh_seconds: int = 300
+    
+    # Фоновый анализ подозрительной активности (0 воркеров - анализ прямо в запросе)
+    analysis_workers: int = 2
+    analysis_max_attempts: int = 3
+    # Задание в статусе running без обновлений дольше аренды перезапускается при старте (секунды)
+    analysis_job_lease_seconds: int = 300
+    
+    # Фоновые выгрузки в файлы (0 воркеров - выгрузка прямо в запросе)
+    export_workers: int = 1
+    export_max_attempts: int = 2
+    export_dir: str = "exports"
+    export_artifact_ttl_hours: int = 24
+    export_cleanup_interval_seconds: int = 600
+    # Задание в статусе running без обновлений дольше аренды перезапускается при старте (секунды);
+    # прогресс обновляет задание только на PostgreSQL - в SQLite аренда должна превышать
+    # самую долгую выгрузку
+    export_job_lease_seconds: int = 3600
+    # Инкрементальная выгрузка не отдает изменения моложе этой задержки (секунды), чтобы не
+    # пропустить незафиксированные транзакции; вне PostgreSQL должна превышать самую долгую
+    # пишущую транзакцию
+    export_watermark_lag_seconds: int = 30
+    # Синхронные выгрузки: процессы рендеринга (0 - в потоке запроса), одновременные выгрузки
+    # и Retry-After для ответа 429, когда все слоты заняты
+    export_render_workers: int = 2
+    export_max_concurrent: int = 4
+    export_retry_after_seconds: int = 10
+    
+    # Кэш готовых выгрузок (байты); каталог - для хранения кэша на диске (пусто - только память)
+    export_cache_max_bytes: int = 64 * 1024 * 1024
+    export_cache_dir: str = ""
+    
+    # Нечеткая проверка текстовых ответов: опечатки в словах не короче порога
+    # (слова с цифрами - только точно), порядок слов должен совпадать
+    grading_fuzzy_enabled: bool = False
+    grading_min_fuzzy_token_length: int = 5
+    grading_max_edit_distance_ratio: float = 0.15  # доля длины слова, но не меньше одной правки
+    
+    # Порог похожести (оценка Жаккара по MinHash) для почти одинаковых ответов
+    near_duplicate_threshold: float = 0.8
+    
+    # Профилировщик SQL-запросов: N+1 по запросу и журнал медленных запросов
+    query_profiler_enabled: bool = False
+    query_profiler_n_plus_one_threshold: int = 5  # повторов одной формы запроса
+    slow_query_threshold_ms: float = 200.0
+    
     # Email
     smtp_host: str = "smtp.gmail.com"
     smtp_port: int = 587
@@ -34,6 +94,16 @@ class Settings(BaseSettings):
             url = url.replace("postgres://", "postgresql://", 1)
         return url
     
+    @property
+    def database_url_async(self) -> str:
+        """URL базы данных с асинхронным драйвером (aiosqlite / asyncpg)"""
+        url = self.database_url_fixed
+        if url.startswith("sqlite://"):
+            url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+        elif url.startswith("postgresql://"):
+            url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+        return url
+    
     @property
     def allowed_hosts_list(self) -> List[str]:
         return [host.strip() for host in self.allowed_hosts.split(",")]
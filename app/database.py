@@ -1,17 +1,95 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from app.config import settings
 
-# Создаем engine с поддержкой SQLite и PostgreSQL
-if settings.database_url.startswith("sqlite"):
-    engine = create_engine(
-        settings.database_url, 
-        connect_args={"check_same_thread": False}
+
+class PoolStats:
+    """Счетчики пула соединений: ожидание выдачи соединения и таймауты"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self, wait: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            if wait > self.wait_max:
+                self.wait_max = wait
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": (self.wait_total / self.checkouts * 1000) if self.checkouts else 0.0,
+                "wait_max_ms": self.wait_max * 1000,
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "in_use": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+            })
+        return data
+
+
+def _timed_pool_class(base, stats: PoolStats):
+    """Пул, замеряющий время получения соединения (включая pre-ping и создание)"""
+
+    class TimedPool(base):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                return super().connect()
+            except exc.TimeoutError:
+                stats.record_timeout()
+                raise
+            finally:
+                stats.record_checkout(time.perf_counter() - start)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def engine_options(pool_base, stats: PoolStats) -> Dict[str, Any]:
+    """Параметры engine: пул из настроек, для SQLite - без ограничения потоков"""
+    options: Dict[str, Any] = {}
+    if settings.database_url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in settings.database_url:
+            # Для базы в памяти оставляем пул SQLAlchemy по умолчанию
+            return options
+    options.update(
+        poolclass=_timed_pool_class(pool_base, stats),
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
     )
-else:
-    # Используем исправленный URL для PostgreSQL
-    engine = create_engine(settings.database_url_fixed)
+    return options
+
+
+pool_stats = PoolStats()
+
+# Создаем engine с поддержкой SQLite и PostgreSQL (URL исправлен для Heroku)
+engine = create_engine(settings.database_url_fixed, **engine_options(QueuePool, pool_stats))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -23,4 +101,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
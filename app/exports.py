@@ -0,0 +1,400 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from sqlalchemy import or_
+
+from app.config import settings
+from app.metrics import metrics
+from app.database import SessionLocal, engine
+from app.models import ExportJob
+from app.services import ExportService
+from app import rendering
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_filters(test_id: Optional[int] = None, date_from: Optional[datetime] = None,
+                    date_to: Optional[datetime] = None, include_suspicious: bool = True) -> Dict[str, Any]:
+    return {
+        "test_id": test_id,
+        "date_from": date_from.isoformat() if date_from else None,
+        "date_to": date_to.isoformat() if date_to else None,
+        "include_suspicious": include_suspicious
+    }
+
+
+def _decode_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    filters = dict(filters or {})
+    for key in ("date_from", "date_to"):
+        if filters.get(key):
+            filters[key] = datetime.fromisoformat(filters[key])
+    return filters
+
+
+class ExportJobQueue:
+    """Очередь фоновых выгрузок в файлы.
+
+    Задания хранятся в таблице export_jobs, файл пишется во временный
+    {id}.{ext}.part и переименовывается после успешного завершения, поэтому
+    скачать можно только целый файл. Файлы с истекшим сроком хранения
+    удаляются фоновым потоком очистки. Задание в статусе running считается
+    брошенным, только если его не обновляли дольше lease_seconds.
+    """
+
+    # Не чаще одной записи прогресса в базу за интервал (секунды)
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, workers: int, max_attempts: int, export_dir: str,
+                 ttl_hours: int, cleanup_interval_seconds: int, lease_seconds: int):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = timedelta(seconds=lease_seconds)
+        self.export_dir = export_dir
+        self.ttl = timedelta(hours=ttl_hours)
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cleanup_thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        # Прогресс выполняющихся заданий этого процесса: job_id -> строк записано
+        self._progress: Dict[int, int] = {}
+        # SQLite не дает писать в базу, пока открыт курсор выгрузки, -
+        # там прогресс виден только из памяти процесса
+        self._persist_progress = engine.dialect.name != "sqlite"
+
+    @property
+    def is_inline(self) -> bool:
+        """Выгрузка выполняется синхронно в вызывающем потоке"""
+        return self._executor is None
+
+    def start(self) -> None:
+        os.makedirs(self.export_dir, exist_ok=True)
+        self._stopped.clear()
+        with self._lock:
+            if self._cleanup_thread is None:
+                self._cleanup_thread = threading.Thread(
+                    target=self._cleanup_loop, name="export-cleanup", daemon=True
+                )
+                self._cleanup_thread.start()
+
+        if self.workers <= 0:
+            return
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="export"
+                )
+
+        for job_id in self._recover_pending_jobs():
+            self.enqueue(job_id)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+            cleanup_thread, self._cleanup_thread = self._cleanup_thread, None
+        if executor:
+            # Прерванные выгрузки останутся в базе и будут перезапущены при следующем запуске
+            executor.shutdown(wait=True, cancel_futures=True)
+        if cleanup_thread:
+            cleanup_thread.join()
+
+    def create_job(self, db, format: str, **filters) -> ExportJob:
+        job = ExportJob(format=format, filters=_encode_filters(**filters), status="pending")
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def enqueue(self, job_id: int) -> None:
+        executor = self._executor
+        if executor is None:
+            self._run_job(job_id)
+            return
+
+        try:
+            executor.submit(self._run_job, job_id)
+        except RuntimeError:
+            logger.warning("Export queue is stopped, job %s left pending", job_id)
+
+    def rows_written(self, job: ExportJob) -> int:
+        """Сколько строк записано: для выполняющихся заданий - из памяти, если есть"""
+        return self._progress.get(job.id, job.rows_written or 0)
+
+    def artifact_path(self, job_id: int, format: str) -> str:
+        return os.path.join(self.export_dir, f"{job_id}.{ExportService.export_file_extension(format)}")
+
+    def _recover_pending_jobs(self):
+        db = SessionLocal()
+        try:
+            # Задания в статусе running с истекшей арендой остались от прерванного процесса;
+            # updated_at ставится при захвате задания и при записи прогресса
+            expired = datetime.now(timezone.utc) - self.lease
+            db.query(ExportJob).filter(
+                ExportJob.status == "running",
+                or_(ExportJob.updated_at.is_(None), ExportJob.updated_at < expired)
+            ).update({"status": "pending", "rows_written": 0}, synchronize_session=False)
+            db.commit()
+            return [
+                job_id
+                for (job_id,) in db.query(ExportJob.id).filter(
+                    ExportJob.status == "pending"
+                ).order_by(ExportJob.id)
+            ]
+        finally:
+            db.close()
+
+    def _run_job(self, job_id: int) -> None:
+        db = SessionLocal()
+        try:
+            # Захватываем задание, чтобы его не выполнили дважды
+            claimed = db.query(ExportJob).filter(
+                ExportJob.id == job_id,
+                ExportJob.status == "pending"
+            ).update(
+                {"status": "running", "attempts": ExportJob.attempts + 1, "rows_written": 0},
+                synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return
+
+            job = db.get(ExportJob, job_id)
+            try:
+                self._render(db, job)
+            except Exception as e:
+                db.rollback()
+                self._handle_failure(db, job_id, e)
+        finally:
+            self._progress.pop(job_id, None)
+            db.close()
+
+    def _render(self, db, job: ExportJob) -> None:
+        filters = _decode_filters(job.filters)
+        job.total_rows = ExportService.count_export_rows(db, job.format, **filters)
+        db.commit()
+
+        path = self.artifact_path(job.id, job.format)
+        part_path = path + ".part"
+        job_id = job.id
+        last_saved = time.monotonic()
+
+        def progress(rows: int) -> None:
+            nonlocal last_saved
+            self._progress[job_id] = rows
+            now = time.monotonic()
+            if self._persist_progress and now - last_saved >= self.PROGRESS_INTERVAL:
+                last_saved = now
+                self._save_progress(job_id, rows)
+
+        try:
+            with open(part_path, "wb") as artifact:
+                for chunk in ExportService.render_export(db, job.format, progress=progress, **filters):
+                    artifact.write(chunk)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+        completed_at = datetime.now(timezone.utc)
+        job.status = "done"
+        job.rows_written = self._progress.get(job_id, 0)
+        job.file_path = path
+        job.file_size = os.path.getsize(path)
+        job.error = None
+        job.completed_at = completed_at
+        job.expires_at = completed_at + self.ttl
+        db.commit()
+
+    def _save_progress(self, job_id: int, rows: int) -> None:
+        db = SessionLocal()
+        try:
+            db.query(ExportJob).filter(ExportJob.id == job_id).update(
+                {"rows_written": rows}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _handle_failure(self, db, job_id: int, error: Exception) -> None:
+        logger.exception("Export job %s failed", job_id)
+
+        job = db.get(ExportJob, job_id)
+        job.error = str(error)
+        retry = job.attempts < self.max_attempts
+        job.status = "pending" if retry else "failed"
+        db.commit()
+
+        if retry:
+            self.enqueue(job_id)
+
+    def _cleanup_loop(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.cleanup_expired()
+            except Exception:
+                logger.exception("Export cleanup failed")
+            self._stopped.wait(self.cleanup_interval_seconds)
+
+    def cleanup_expired(self, now: Optional[datetime] = None) -> int:
+        """Удаляет файлы выгрузок с истекшим сроком хранения; возвращает число заданий"""
+        now = now or datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            expired = db.query(ExportJob).filter(
+                ExportJob.status == "done",
+                ExportJob.expires_at <= now
+            ).all()
+            for job in expired:
+                if job.file_path and os.path.exists(job.file_path):
+                    os.remove(job.file_path)
+                job.status = "expired"
+            db.commit()
+            return len(expired)
+        finally:
+            db.close()
+
+
+class ExportPoolSaturated(Exception):
+    """Все слоты синхронных выгрузок заняты - клиенту стоит повторить позже"""
+
+
+class ExportPoolUnavailable(Exception):
+    """Процессы рендеринга падают и после перезапуска пула"""
+
+
+class ExportRenderPool:
+    """Синхронные выгрузки с рендерингом в пуле процессов.
+
+    Сериализация JSON с отступами и Markdown-отчетов - чистая работа CPU; в
+    потоке веб-воркера она держит GIL и тормозит остальные запросы (в том
+    числе отправку ответов). Данные читаются в запросе компактными кортежами,
+    а рендеринг выполняется в отдельном процессе. Число одновременных выгрузок
+    ограничено: при занятых слотах slot() сразу бросает ExportPoolSaturated,
+    а не ставит запрос в очередь.
+    """
+
+    def __init__(self, workers: int, max_concurrent: int):
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: дочерние процессы не наследуют потоки и соединения с базой
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def start(self) -> None:
+        if self.workers <= 0:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        if not self._slots.acquire(blocking=False):
+            raise ExportPoolSaturated()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def run(self, function: Callable[..., bytes], *args) -> bytes:
+        """Выполняет функцию рендеринга в пуле процессов (без пула - в текущем потоке).
+
+        Если процесс пула упал (например, убит по памяти), пул сломан целиком: он
+        пересоздается, и рендеринг повторяется один раз; повторный сбой -
+        ExportPoolUnavailable.
+        """
+        for _ in range(2):
+            executor = self._executor
+            if executor is None:
+                return function(*args)
+            try:
+                return executor.submit(function, *args).result()
+            except BrokenProcessPool:
+                logger.exception("Export render pool is broken, restarting it")
+                self._replace_broken(executor)
+        raise ExportPoolUnavailable()
+
+    def _replace_broken(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Пул мог уже пересоздать другой поток или остановить stop()
+            if self._executor is not broken:
+                return
+            self._executor = self._create_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def render_download(self, db, format: str, **filters) -> bytes:
+        rows = ExportService.export_rows(db, **filters)
+        # Соединение не нужно на время рендеринга
+        db.rollback()
+        with metrics.time_export(f"{format}_download"):
+            return self.run(rendering.render_download, format, rows, datetime.utcnow())
+
+    def stream_markdown(self, db, **filters) -> Iterator[bytes]:
+        """Markdown-отчет для скачивания потоком: результаты читаются пачками по
+        STREAM_BATCH_SIZE, каждая пачка рендерится в пуле и сразу отдается клиенту.
+
+        Слот занимается при получении первого фрагмента (заголовка) и держится,
+        пока отдается отчет.
+        """
+        with self.slot(), metrics.time_export("markdown_download"):
+            total_results, last_id = ExportService.export_results_range(db, **filters)
+            db.rollback()
+            yield rendering.markdown_header(datetime.utcnow(), total_results).encode("utf-8")
+
+            after_id = None
+            while last_id is not None and (after_id is None or after_id < last_id):
+                rows = ExportService.export_rows(
+                    db, after_id=after_id, until_id=last_id, limit=ExportService.STREAM_BATCH_SIZE, **filters
+                )
+                # Соединение не нужно на время рендеринга и отправки пачки
+                db.rollback()
+                if not rows.results:
+                    return
+                yield self.run(rendering.render_markdown_batch, rows)
+                after_id = rows.results[-1].id
+
+    def render_response(self, db, format: str, filename: str, **filters) -> bytes:
+        rows = ExportService.export_rows(db, **filters)
+        db.rollback()
+        with metrics.time_export(format):
+            return self.run(rendering.render_response, format, rows, datetime.utcnow(), filename)
+
+
+export_queue = ExportJobQueue(
+    workers=settings.export_workers,
+    max_attempts=settings.export_max_attempts,
+    export_dir=settings.export_dir,
+    ttl_hours=settings.export_artifact_ttl_hours,
+    cleanup_interval_seconds=settings.export_cleanup_interval_seconds,
+    lease_seconds=settings.export_job_lease_seconds
+)
+
+export_render_pool = ExportRenderPool(
+    workers=settings.export_render_workers,
+    max_concurrent=settings.export_max_concurrent
+)
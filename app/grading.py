@@ -0,0 +1,181 @@
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.cache import catalog_cache
+from app.config import settings
+from app.models import Test, Question
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_answer(text: Optional[str]) -> str:
+    """Каноническая форма ответа: NFKC, нижний регистр, без пунктуации и лишних пробелов"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _within_edit_distance(a: str, b: str, max_distance: int) -> bool:
+    """Расстояние Левенштейна не больше max_distance (с ранним выходом)"""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            )
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > max_distance:
+            return False
+        previous = current
+    return previous[-1] <= max_distance
+
+
+def _token_matches(token: str, reference: str) -> bool:
+    """Слово совпадает с эталонным или отличается опечаткой; короткие слова и слова
+    с цифрами (коды статусов, версии, номера) должны совпадать точно"""
+    if token == reference:
+        return True
+    if len(reference) < settings.grading_min_fuzzy_token_length or any(char.isdigit() for char in token + reference):
+        return False
+    max_distance = max(1, int(len(reference) * settings.grading_max_edit_distance_ratio))
+    return _within_edit_distance(token, reference, max_distance)
+
+
+class CompiledQuestion:
+    """Вопрос, подготовленный к проверке: нормализованные эталоны, их токены
+    и номера верных вариантов для multiple_choice"""
+
+    __slots__ = ("id", "points", "is_choice", "gradable", "canonical", "token_lists", "option_indexes", "correct_options")
+
+    def __init__(self, question: Question):
+        self.id = question.id
+        self.points = float(question.points or 0)
+        self.is_choice = question.question_type == "multiple_choice"
+
+        references = [question.correct_answer] if question.correct_answer is not None else []
+        references.extend(question.accepted_answers or [])
+        self.canonical = frozenset(filter(None, (normalize_answer(reference) for reference in references)))
+        self.token_lists: Tuple[Tuple[str, ...], ...] = tuple(tuple(form.split()) for form in self.canonical)
+        # Вопрос без эталона не оценивается и не входит в максимальный балл
+        self.gradable = bool(self.canonical)
+
+        self.option_indexes: Dict[str, int] = {}
+        for index, option in enumerate(question.options or []):
+            self.option_indexes.setdefault(normalize_answer(option), index)
+        self.correct_options = frozenset(
+            self.option_indexes[form] for form in self.canonical if form in self.option_indexes
+        )
+
+    def grade(self, answer_text: str) -> Optional[bool]:
+        """True/False - результат проверки, None - вопрос не оценивается"""
+        if not self.gradable:
+            return None
+
+        answer = normalize_answer(answer_text)
+        if self.is_choice and self.correct_options:
+            # Вариант сравнивается по номеру; ответ не из списка вариантов - неверный
+            index = self.option_indexes.get(answer)
+            return index is not None and index in self.correct_options
+
+        if answer in self.canonical:
+            return True
+        if self.is_choice or not answer or not settings.grading_fuzzy_enabled:
+            return False
+        return self._fuzzy_match(answer)
+
+    def _fuzzy_match(self, answer: str) -> bool:
+        """Опечатки в отдельных словах: слова сравниваются попарно и по порядку,
+        поэтому перестановка слов (PUT/PATCH, 1D/2D) ответ не засчитывает"""
+        tokens = answer.split()
+        return any(
+            len(tokens) == len(reference) and all(map(_token_matches, tokens, reference))
+            for reference in self.token_lists
+        )
+
+
+class CompiledTest:
+    __slots__ = ("id", "is_active", "questions", "version", "loaded_at")
+
+    def __init__(self, test: Test, questions: Iterable[Question], version: int):
+        self.id = test.id
+        self.is_active = bool(test.is_active)
+        self.questions: Dict[int, CompiledQuestion] = {question.id: CompiledQuestion(question) for question in questions}
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+
+class GradingCache:
+    """Скомпилированные вопросы тестов, привязанные к версии каталога.
+
+    Любая запись в tests/questions увеличивает catalog_cache.version, и устаревшие
+    записи перестают использоваться; TTL - как у кэша каталога.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._tests: Dict[int, CompiledTest] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, compiled: Optional[CompiledTest], version: int, now: float) -> bool:
+        return (
+            compiled is not None
+            and compiled.version == version
+            and now - compiled.loaded_at < self.ttl_seconds
+        )
+
+    def get_tests(self, db: Session, test_ids: Iterable[int]) -> Dict[int, CompiledTest]:
+        """Скомпилированные тесты по id (несуществующие тесты в ответ не попадают);
+        промахи загружаются двумя запросами на все тесты сразу"""
+        version = catalog_cache.version
+        now = time.monotonic()
+        found: Dict[int, CompiledTest] = {}
+        missing: List[int] = []
+        for test_id in set(test_ids):
+            compiled = self._tests.get(test_id)
+            if self._fresh(compiled, version, now):
+                found[test_id] = compiled
+            else:
+                missing.append(test_id)
+
+        if missing:
+            tests = db.query(Test).filter(Test.id.in_(missing)).all()
+            questions_by_test: Dict[int, List[Question]] = {test.id: [] for test in tests}
+            if tests:
+                for question in db.query(Question).filter(Question.test_id.in_(list(questions_by_test))):
+                    questions_by_test[question.test_id].append(question)
+
+            loaded = {test.id: CompiledTest(test, questions_by_test[test.id], version) for test in tests}
+            with self._lock:
+                # Не кэшируем данные, прочитанные до инвалидации
+                if catalog_cache.version == version:
+                    self._tests.update(loaded)
+            found.update(loaded)
+
+        return found
+
+    def get_test(self, db: Session, test_id: int) -> Optional[CompiledTest]:
+        return self.get_tests(db, [test_id]).get(test_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tests.clear()
+
+
+grading_cache = GradingCache(ttl_seconds=settings.catalog_cache_ttl_seconds)
@@ -1,11 +1,17 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
 from app.config import settings
-from app.database import engine
+from app.database import engine, pool_stats, SessionLocal
+from app.async_database import async_engine, async_pool_stats
 from app.models import Base
+from app.analysis import analysis_queue
+from app.exports import export_queue, export_render_pool
+from app.ranking import score_ranking
+from app.metrics import metrics, MetricsMiddleware
+from app import profiler
 from app.routers import tests, submissions, results
 
 
@@ -13,7 +19,23 @@ from app.routers import tests, submissions, results
 async def lifespan(app: FastAPI):
     # Создаем таблицы при запуске
     Base.metadata.create_all(bind=engine)
+    # Строим распределения баллов для перцентилей
+    db = SessionLocal()
+    try:
+        score_ranking.load(db)
+    finally:
+        db.close()
+    # Запускаем фоновый анализ и подхватываем незавершенные задания
+    analysis_queue.start()
+    # Фоновые выгрузки: незавершенные задания и очистка просроченных файлов
+    export_queue.start()
+    # Процессы рендеринга синхронных выгрузок
+    export_render_pool.start()
     yield
+    export_render_pool.stop()
+    export_queue.stop()
+    analysis_queue.stop()
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -32,6 +54,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Учет SQL-запросов для метрик и профилировщика - один обработчик событий движков
+profiler.instrument_engine(engine)
+profiler.instrument_engine(async_engine.sync_engine)
+
+# Профилировщик SQL-запросов (включается в Settings)
+if settings.query_profiler_enabled:
+    app.add_middleware(profiler.QueryProfilerMiddleware)
+
+# Метрики запросов: подключается последним, чтобы оборачивать CORS и учитывать все ответы
+app.add_middleware(MetricsMiddleware)
+
 # Подключаем роутеры
 app.include_router(tests.router)
 app.include_router(submissions.router)
@@ -54,12 +87,28 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/db-pool")
+async def db_pool_stats():
+    """Состояние пулов соединений с базой данных"""
+    return {
+        "sync": pool_stats.snapshot(engine.pool),
+        "async": async_pool_stats.snapshot(async_engine.pool)
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     """Обработчик HTTP исключений"""
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail, "error_code": exc.status_code}
+        content={"detail": exc.detail, "error_code": exc.status_code},
+        headers=exc.headers
     )
 
 
@@ -0,0 +1,192 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence
+
+from app.profiler import QueryCounter, track_queries
+
+
+# Границы корзин гистограмм (как у prometheus_client по умолчанию)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+EXPORT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound))
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами; observe не выделяет память"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str, lines: List[str]) -> None:
+        prefix = labels + "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{_format_bound(bound)}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        suffix = "{%s}" % labels if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+
+
+class RouteMetrics:
+    """Метрики одного маршрута; строка меток формируется один раз при создании"""
+
+    __slots__ = ("labels", "status_counts", "latency", "response_size", "db_queries", "db_seconds")
+
+    def __init__(self, method: str, route: str):
+        self.labels = f'method="{_escape(method)}",route="{_escape(route)}"'
+        self.status_counts: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.db_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = Histogram(LATENCY_BUCKETS)
+
+
+class MetricsRegistry:
+    """Метрики HTTP-запросов, SQL и экспорта в формате Prometheus.
+
+    Обновления метрик запросов выполняются в потоке event loop, поэтому без
+    блокировок; длительности экспорта приходят из потоков пула и пишутся под
+    блокировкой.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, RouteMetrics]] = {}
+        self._exports: Dict[str, Histogram] = {}
+        self._export_lock = threading.Lock()
+        self.in_flight = 0
+
+    def route_metrics(self, route, method: str) -> RouteMetrics:
+        # Ключ - шаблон пути маршрута (объекты маршрутов Starlette нехэшируемы)
+        path = getattr(route, "path", None) or UNMATCHED_ROUTE
+        by_method = self._routes.get(path)
+        if by_method is None:
+            by_method = self._routes[path] = {}
+        metrics = by_method.get(method)
+        if metrics is None:
+            # Создается один раз на маршрут и метод
+            metrics = by_method[method] = RouteMetrics(method, path)
+        return metrics
+
+    def observe_export(self, format: str, seconds: float) -> None:
+        with self._export_lock:
+            histogram = self._exports.get(format)
+            if histogram is None:
+                histogram = self._exports[format] = Histogram(EXPORT_BUCKETS)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time_export(self, format: str) -> Iterator[None]:
+        """Замер длительности экспорта; работает и внутри генераторов потоковой выгрузки"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_export(format, time.perf_counter() - started)
+
+    def render(self) -> str:
+        routes = [metrics for by_method in list(self._routes.values()) for metrics in list(by_method.values())]
+        lines: List[str] = []
+
+        lines.append("# HELP http_requests_total Total HTTP requests by route and status code")
+        lines.append("# TYPE http_requests_total counter")
+        for metrics in routes:
+            for status, count in sorted(metrics.status_counts.items()):
+                lines.append(f'http_requests_total{{{metrics.labels},status="{status}"}} {count}')
+
+        lines.append("# HELP http_requests_in_flight HTTP requests currently being processed")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        for name, attribute, help_text in (
+            ("http_request_duration_seconds", "latency", "HTTP request latency including the response body"),
+            ("http_response_size_bytes", "response_size", "HTTP response body size"),
+            ("http_request_db_queries", "db_queries", "SQL statements executed per HTTP request"),
+            ("http_request_db_seconds", "db_seconds", "Time spent in SQL statements per HTTP request"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for metrics in routes:
+                getattr(metrics, attribute).render(name, metrics.labels, lines)
+
+        lines.append("# HELP export_duration_seconds Export rendering duration by format")
+        lines.append("# TYPE export_duration_seconds histogram")
+        with self._export_lock:
+            for format, histogram in sorted(self._exports.items()):
+                histogram.render("export_duration_seconds", f'format="{_escape(format)}"', lines)
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка, размер ответа, статус и SQL-запросы по маршрутам.
+
+    Время считается до отправки последнего фрагмента тела, поэтому потоковые
+    выгрузки учитываются целиком.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        # SQL-запросы считает профилировщик (app.profiler.instrument_engine)
+        queries = QueryCounter()
+        status_code = 500
+        response_size = 0
+        registry.in_flight += 1
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            with track_queries(queries):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+
+            route_metrics = registry.route_metrics(scope.get("route"), scope["method"])
+            route_metrics.status_counts[status_code] = route_metrics.status_counts.get(status_code, 0) + 1
+            route_metrics.latency.observe(elapsed)
+            route_metrics.response_size.observe(response_size)
+            route_metrics.db_queries.observe(queries.count)
+            route_metrics.db_seconds.observe(queries.seconds)
@@ -0,0 +1,69 @@
+import hashlib
+import random
+from array import array
+from typing import List, Optional, Sequence
+
+from app.grading import normalize_answer
+
+# 64 перестановки = 16 полос по 4 строки: пары с похожестью ~0.5 и выше
+# попадают в общую корзину хотя бы одной полосы с высокой вероятностью
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 5
+MIN_SHINGLES = 8  # более короткие ответы слишком часто совпадают случайно
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 61) - 1
+
+# Фиксированное зерно: сигнатуры, сохраненные в базе, должны оставаться сравнимыми
+_rng = random.Random(0x51A7)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def _shingle_hashes(text: str) -> List[int]:
+    normalized = normalize_answer(text)
+    if len(normalized) < SHINGLE_SIZE + MIN_SHINGLES - 1:
+        return []
+    shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    return [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        for shingle in shingles
+    ]
+
+
+def signature(text: str) -> Optional[array]:
+    """MinHash-сигнатура по символьным 5-граммам нормализованного текста
+    (None для слишком коротких ответов)"""
+    hashes = _shingle_hashes(text)
+    if not hashes:
+        return None
+    values = array("Q")
+    for a, b in _PERMUTATIONS:
+        values.append(min((a * value + b) % _PRIME for value in hashes))
+    return values
+
+
+def band_hashes(values: Sequence[int]) -> List[int]:
+    """Ключи LSH-корзин по полосам сигнатуры (знаковые 64-битные, влезают в BIGINT)"""
+    keys = []
+    for band in range(BANDS):
+        chunk = array("Q", values[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]).tobytes()
+        digest = hashlib.blake2b(chunk, digest_size=8, person=b"band%02d" % band).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def similarity(first: Sequence[int], second: Sequence[int]) -> float:
+    """Оценка коэффициента Жаккара по доле совпавших минимумов"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERMUTATIONS
+
+
+def to_bytes(values: array) -> bytes:
+    return values.tobytes()
+
+
+def from_bytes(data: bytes) -> array:
+    values = array("Q")
+    values.frombytes(data)
+    return values
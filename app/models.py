@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, JSON
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, Float, JSON, LargeBinary,
+    Index, UniqueConstraint
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -29,6 +32,7 @@ class Test(Base):
     is_active = Column(Boolean, default=True)
     time_limit_per_question = Column(Integer, default=90)  # seconds
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
     questions = relationship("Question", back_populates="test")
@@ -44,9 +48,11 @@ class Question(Base):
     question_type = Column(String(50), nullable=False)  # 'text', 'multiple_choice'
     options = Column(JSON, nullable=True)  # для множественного выбора
     correct_answer = Column(Text, nullable=True)
+    accepted_answers = Column(JSON, nullable=True)  # допустимые альтернативные формулировки ответа
     points = Column(Integer, default=1)
     order = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
     test = relationship("Test", back_populates="questions")
@@ -66,12 +72,23 @@ class TestResult(Base):
     percentage = Column(Float, default=0.0)
     is_suspicious = Column(Boolean, default=False)
     suspicious_reasons = Column(JSON, nullable=True)
+    analysis_status = Column(String(20), default="pending")  # 'pending', 'done', 'failed'
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Время последнего изменения (в т.ч. фоновым анализом) - водяной знак инкрементальной выгрузки
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
     
     # Relationships
     user = relationship("User", back_populates="results")
     test = relationship("Test", back_populates="results")
     answers = relationship("Answer", back_populates="test_result")
+    
+    # Индексы под keyset-пагинацию списка результатов (created_at, id)
+    __table_args__ = (
+        Index("ix_test_results_created_at_id", "created_at", "id"),
+        Index("ix_test_results_test_id_created_at", "test_id", "created_at", "id"),
+        Index("ix_test_results_is_suspicious_created_at", "is_suspicious", "created_at", "id"),
+        Index("ix_test_results_updated_at_id", "updated_at", "id"),
+    )
 
 
 class Answer(Base):
@@ -81,6 +98,7 @@ class Answer(Base):
     test_result_id = Column(Integer, ForeignKey("test_results.id"), nullable=False)
     question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
     answer_text = Column(Text, nullable=False)
+    answer_hash = Column(String(64), nullable=True)  # sha256 нормализованного текста ответа
     is_correct = Column(Boolean, nullable=True)
     points_earned = Column(Float, default=0.0)
     time_spent = Column(Integer, nullable=True)  # seconds
@@ -89,6 +107,60 @@ class Answer(Base):
     # Relationships
     test_result = relationship("TestResult", back_populates="answers")
     question = relationship("Question", back_populates="answers")
+    
+    __table_args__ = (
+        Index("ix_answers_question_id_answer_hash", "question_id", "answer_hash"),
+    )
+
+
+class AnswerFingerprint(Base):
+    """Счетчик одинаковых (после нормализации) ответов на вопрос"""
+    __tablename__ = "answer_fingerprints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    answer_hash = Column(String(64), nullable=False)
+    answer_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("question_id", "answer_hash", name="uq_answer_fingerprints_question_hash"),
+    )
+
+
+class AnswerSignature(Base):
+    """MinHash-сигнатура текстового ответа для поиска почти одинаковых ответов"""
+    __tablename__ = "answer_signatures"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    answer_id = Column(Integer, ForeignKey("answers.id"), unique=True, nullable=False)
+    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    test_result_id = Column(Integer, ForeignKey("test_results.id"), nullable=False, index=True)
+    signature = Column(LargeBinary, nullable=False)  # 64 минимума по 8 байт
+
+
+class AnswerLshBucket(Base):
+    """LSH-корзина полосы сигнатуры: ответы с общей корзиной - кандидаты в дубликаты"""
+    __tablename__ = "answer_lsh_buckets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    band = Column(Integer, nullable=False)
+    bucket_hash = Column(BigInteger, nullable=False)
+    answer_id = Column(Integer, ForeignKey("answers.id"), nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("question_id", "band", "bucket_hash", "answer_id", name="uq_answer_lsh_buckets_bucket_answer"),
+    )
+
+
+class LshIndexState(Base):
+    """До какого answers.id ответы на вопрос уже внесены в LSH-индекс"""
+    __tablename__ = "lsh_index_state"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), unique=True, nullable=False)
+    last_answer_id = Column(Integer, nullable=False, default=0)
 
 
 class SuspiciousActivity(Base):
@@ -100,4 +172,75 @@ class SuspiciousActivity(Base):
     description = Column(Text, nullable=False)
     confidence_score = Column(Float, default=0.0)
     details = Column(JSON, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
+
+
+class AnalysisJob(Base):
+    """Задание фонового анализа подозрительной активности по результату теста"""
+    __tablename__ = "analysis_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    test_result_id = Column(Integer, ForeignKey("test_results.id"), unique=True, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # 'pending', 'running', 'done', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    payload = Column(JSON, nullable=True)  # данные отправки, которых нет в таблицах (например, total_time)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class ExportJob(Base):
+    """Фоновая выгрузка результатов в файл на диске"""
+    __tablename__ = "export_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    format = Column(String(20), nullable=False)
+    filters = Column(JSON, nullable=True)  # test_id, date_from, date_to, include_suspicious
+    status = Column(String(20), nullable=False, default="pending", index=True)  # 'pending', 'running', 'done', 'failed', 'expired'
+    attempts = Column(Integer, nullable=False, default=0)
+    rows_written = Column(Integer, nullable=False, default=0)
+    total_rows = Column(Integer, nullable=True)
+    file_path = Column(String(500), nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+
+class TestStatistics(Base):
+    """Агрегаты по тесту, обновляются инкрементально при каждой отправке"""
+    __tablename__ = "test_statistics"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), unique=True, nullable=False)
+    result_count = Column(Integer, nullable=False, default=0)
+    percentage_sum = Column(Float, nullable=False, default=0.0)
+    percentage_sq_sum = Column(Float, nullable=False, default=0.0)
+    suspicious_count = Column(Integer, nullable=False, default=0)
+
+
+class TestScoreBucket(Base):
+    """Гистограмма процентов по тесту: корзина 0 - [0, 10), ..., 9 - [90, 100]"""
+    __tablename__ = "test_score_buckets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False)
+    bucket = Column(Integer, nullable=False)
+    result_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint("test_id", "bucket", name="uq_test_score_buckets_test_bucket"),
+    )
+
+
+class QuestionStatistics(Base):
+    """Сколько раз на вопрос ответили и сколько из этих ответов верные"""
+    __tablename__ = "question_statistics"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), unique=True, nullable=False)
+    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False, index=True)
+    answered_count = Column(Integer, nullable=False, default=0)
+    correct_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,211 @@
+import json
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, TypeVar
+
+from sqlalchemy import event
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.profiler.slow_query")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Форма запроса без значений: литералы и плейсхолдеры -> ?, списки IN (?, ?, ...) -> (?+)"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(?+)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class StatementStats:
+    __slots__ = ("statement", "count", "seconds")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.seconds = 0.0
+
+
+class QueryCounter:
+    """Число и длительность SQL-запросов блока track_queries() (метрики, бенчмарк)"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # Счетчик объемлющего блока: запрос учитывается во всех вложенных блоках
+        self.parent: Optional["QueryCounter"] = None
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+
+
+class QueryProfile(QueryCounter):
+    """Запросы, выполненные в рамках одного HTTP-запроса или блока profile_queries()"""
+
+    def __init__(self, label: str = "", n_plus_one_threshold: Optional[int] = None):
+        super().__init__()
+        self.label = label
+        self.n_plus_one_threshold = n_plus_one_threshold or settings.query_profiler_n_plus_one_threshold
+        self.statements: Dict[str, StatementStats] = {}
+
+    def record(self, statement: str, seconds: float) -> None:
+        key = fingerprint(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats(statement)
+        stats.count += 1
+        stats.seconds += seconds
+        super().record(statement, seconds)
+
+    def suspected_n_plus_one(self) -> Dict[str, int]:
+        """Формы запросов, повторившиеся не меньше порога раз - вероятный N+1"""
+        return {
+            key: stats.count
+            for key, stats in self.statements.items()
+            if stats.count >= self.n_plus_one_threshold
+        }
+
+    def summary(self) -> dict:
+        return {
+            "label": self.label,
+            "queries": self.count,
+            "duration_ms": round(self.seconds * 1000, 3),
+            "statements": [
+                {"fingerprint": key, "count": stats.count, "duration_ms": round(stats.seconds * 1000, 3)}
+                for key, stats in sorted(self.statements.items(), key=lambda item: -item[1].count)
+            ],
+            "suspected_n_plus_one": self.suspected_n_plus_one()
+        }
+
+    def assert_budget(self, max_queries: Optional[int] = None, max_repeats: Optional[int] = None) -> None:
+        """Проверка бюджета запросов: общее число и число повторов одной формы"""
+        problems: List[str] = []
+        if max_queries is not None and self.count > max_queries:
+            problems.append(f"{self.count} queries executed, budget is {max_queries}")
+        if max_repeats is not None:
+            for key, stats in self.statements.items():
+                if stats.count > max_repeats:
+                    problems.append(f"{stats.count}x (budget {max_repeats}): {key}")
+        if problems:
+            raise AssertionError("Query budget exceeded:\n" + "\n".join(problems))
+
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+Counter = TypeVar("Counter", bound=QueryCounter)
+
+
+def _log_slow_query(statement: str, seconds: float, label: Optional[str]) -> None:
+    slow_query_logger.warning(json.dumps({
+        "event": "slow_query",
+        "duration_ms": round(seconds * 1000, 3),
+        "fingerprint": fingerprint(statement),
+        "statement": statement,
+        "request": label
+    }, ensure_ascii=False))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время старта хранится в контексте выполнения: если запрос упал и after_cursor_execute
+    # не вызван, контекст просто отбрасывается. Без контекста (значения по умолчанию,
+    # последовательности) - одно значение на соединение, следующий запрос его перезапишет
+    started = time.perf_counter()
+    if context is not None:
+        context._profiler_started = started
+    else:
+        conn.info["profiler_query_started"] = started
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        started = getattr(context, "_profiler_started", None)
+    else:
+        started = conn.info.pop("profiler_query_started", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+
+    label = None
+    counter = _current_counter.get()
+    while counter is not None:
+        counter.record(statement, seconds)
+        label = label or getattr(counter, "label", None)
+        counter = counter.parent
+    if settings.query_profiler_enabled and seconds * 1000 >= settings.slow_query_threshold_ms:
+        _log_slow_query(statement, seconds, label)
+
+
+def instrument_engine(engine) -> None:
+    """Подключает учет запросов к движку (повторный вызов ничего не делает)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _instrument_default_engines() -> None:
+    from app.database import engine
+    from app.async_database import async_engine
+
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+
+
+@contextmanager
+def track_queries(counter: Counter) -> Iterator[Counter]:
+    """Учет запросов блока в counter (движки подключаются через instrument_engine);
+    объемлющие блоки продолжают учитывать те же запросы"""
+    counter.parent = _current_counter.get()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+@contextmanager
+def profile_queries(label: str = "", n_plus_one_threshold: Optional[int] = None) -> Iterator[QueryProfile]:
+    """Профилирование запросов внутри блока (для тестов и скриптов):
+
+        with profile_queries() as profile:
+            TestResultService.submit_test(db, submission, user_id)
+        profile.assert_budget(max_queries=10, max_repeats=1)
+    """
+    _instrument_default_engines()
+    with track_queries(QueryProfile(label, n_plus_one_threshold)) as profile:
+        yield profile
+
+
+class QueryProfilerMiddleware:
+    """ASGI-middleware: профиль запросов на каждый HTTP-запрос, предупреждение о вероятных N+1"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(f'{scope["method"]} {scope["path"]}')
+        try:
+            with track_queries(profile):
+                await self.app(scope, receive, send)
+        finally:
+            suspects = profile.suspected_n_plus_one()
+            if suspects:
+                logger.warning(json.dumps(dict(profile.summary(), event="suspected_n_plus_one"), ensure_ascii=False))
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug(json.dumps(dict(profile.summary(), event="query_profile"), ensure_ascii=False))
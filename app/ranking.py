@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import TestResult
+
+
+class FenwickTree:
+    """Дерево Фенвика: добавление и префиксная сумма за O(log n)"""
+
+    __slots__ = ("size", "tree", "total")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def add(self, index: int, delta: int = 1) -> None:
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index: int) -> int:
+        """Сумма по позициям [0, index]"""
+        result = 0
+        i = min(index + 1, self.size)
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+
+class ScoreRanking:
+    """Распределение процентов по каждому тесту для расчета перцентиля кандидата.
+
+    Проценты квантуются с шагом 0.1, поэтому дерево на тест - 1001 позиция.
+    Дерево строится одним GROUP BY-запросом и периодически перестраивается,
+    чтобы учесть результаты, записанные другими процессами.
+    """
+
+    RESOLUTION = 10  # позиций на один процент
+    SIZE = 100 * RESOLUTION + 1
+
+    def __init__(self, refresh_seconds: int):
+        self.refresh_seconds = refresh_seconds
+        self._trees: Dict[int, FenwickTree] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, percentage: float) -> int:
+        return int(round(min(max(percentage or 0.0, 0.0), 100.0) * cls.RESOLUTION))
+
+    def load(self, db: Session, test_id: Optional[int] = None) -> None:
+        """Строит деревья по базе: для одного теста или для всех сразу"""
+        query = db.query(TestResult.test_id, TestResult.percentage, func.count(TestResult.id))
+        if test_id is not None:
+            query = query.filter(TestResult.test_id == test_id)
+
+        trees: Dict[int, FenwickTree] = {}
+        if test_id is not None:
+            trees[test_id] = FenwickTree(self.SIZE)
+        for result_test_id, percentage, count in query.group_by(TestResult.test_id, TestResult.percentage):
+            tree = trees.get(result_test_id)
+            if tree is None:
+                tree = trees[result_test_id] = FenwickTree(self.SIZE)
+            tree.add(self._index(percentage), count)
+
+        now = time.monotonic()
+        with self._lock:
+            for result_test_id, tree in trees.items():
+                self._trees[result_test_id] = tree
+                self._loaded_at[result_test_id] = now
+
+    def record_result(self, db: Session, test_id: int, percentage: float) -> Optional[float]:
+        """Учитывает уже сохраненный результат и возвращает его перцентиль"""
+        loaded_at = self._loaded_at.get(test_id)
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_seconds:
+            # Свежая выборка из базы уже содержит этот результат
+            self.load(db, test_id)
+        else:
+            with self._lock:
+                self._trees[test_id].add(self._index(percentage))
+        return self.percentile(test_id, percentage)
+
+    def percentile(self, test_id: int, percentage: float) -> Optional[float]:
+        """Доля остальных кандидатов (в %), набравших строго меньше"""
+        with self._lock:
+            tree = self._trees.get(test_id)
+            if tree is None or tree.total <= 1:
+                return None
+            index = self._index(percentage)
+            lower = tree.prefix_sum(index - 1) if index > 0 else 0
+            return lower / (tree.total - 1) * 100
+
+
+score_ranking = ScoreRanking(refresh_seconds=settings.ranking_refresh_seconds)
@@ -0,0 +1,226 @@
+"""Рендеринг выгрузок из компактных кортежей.
+
+Модуль не зависит от ORM и базы данных: функции принимают только кортежи
+со значениями, поэтому их можно выполнять в отдельных процессах
+(ProcessPoolExecutor), передавая данные через pickle.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class TestRow(NamedTuple):
+    id: int
+    name: str
+    test_type: str
+    description: Optional[str]
+
+
+class QuestionRow(NamedTuple):
+    id: int
+    order: int
+    question_text: str
+    question_type: str
+    points: float
+    correct_answer: Optional[str]
+
+
+class AnswerRow(NamedTuple):
+    question_id: int
+    answer_text: str
+    is_correct: Optional[bool]
+    points_earned: float
+    time_spent: Optional[int]
+
+
+class ResultRow(NamedTuple):
+    id: int
+    test_id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    total_score: float
+    max_score: float
+    percentage: float
+    started_at: datetime
+    completed_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    is_suspicious: bool
+    suspicious_reasons: Optional[List[str]]
+    analysis_status: Optional[str]
+    answers: Tuple[AnswerRow, ...]
+
+
+class ExportRows(NamedTuple):
+    """Все данные выгрузки: тесты и упорядоченные вопросы по id теста, результаты по порядку"""
+    tests: Dict[int, TestRow]
+    questions: Dict[int, Tuple[QuestionRow, ...]]
+    results: List[ResultRow]
+
+
+def result_to_json(result: ResultRow, test: TestRow, questions: Sequence[QuestionRow]) -> Dict[str, Any]:
+    # Создаем словарь ответов для быстрого поиска
+    answers_dict = {answer.question_id: answer for answer in result.answers}
+
+    # Формируем детальную информацию о вопросах и ответах
+    questions_answers = []
+    for question in questions:
+        answer = answers_dict.get(question.id)
+        question_data = {
+            "question_id": question.id,
+            "question_text": question.question_text,
+            "question_type": question.question_type,
+            "order": question.order,
+            "points": question.points,
+            "correct_answer": question.correct_answer,
+            "candidate_answer": {
+                "answer_text": answer.answer_text if answer else None,
+                "is_correct": answer.is_correct if answer else None,
+                "points_earned": answer.points_earned if answer else 0.0,
+                "time_spent": answer.time_spent if answer else None
+            } if answer else None
+        }
+        questions_answers.append(question_data)
+
+    return {
+        "id": result.id,
+        "user": {
+            "telegram_id": result.telegram_id,
+            "username": result.username,
+            "first_name": result.first_name,
+            "last_name": result.last_name,
+            "full_name": f"{result.first_name or ''} {result.last_name or ''}".strip() or f"User {result.telegram_id}"
+        },
+        "test": {
+            "id": test.id,
+            "name": test.name,
+            "type": test.test_type,
+            "description": test.description
+        },
+        "score": {
+            "total": result.total_score,
+            "max": result.max_score,
+            "percentage": result.percentage
+        },
+        "timing": {
+            "started_at": result.started_at.isoformat(),
+            "completed_at": result.completed_at.isoformat() if result.completed_at else None,
+            "total_duration": (result.completed_at - result.started_at).total_seconds() if result.completed_at else None,
+            "updated_at": result.updated_at.isoformat() if result.updated_at else None
+        },
+        "suspicious": {
+            "is_suspicious": result.is_suspicious,
+            "reasons": result.suspicious_reasons or [],
+            "analysis_status": result.analysis_status or "done"
+        },
+        "questions_and_answers": questions_answers
+    }
+
+
+def markdown_header(export_date: datetime, total_results: int) -> str:
+    return f"""# Quantum Insight - Результаты тестирования
+
+**Дата экспорта:** {export_date.strftime('%d.%m.%Y %H:%M:%S')}
+**Всего результатов:** {total_results}
+
+---
+
+"""
+
+
+def result_to_markdown(result: ResultRow, test: TestRow, questions: Sequence[QuestionRow]) -> Iterator[str]:
+    answers_dict = {answer.question_id: answer for answer in result.answers}
+
+    yield f"""## Результат #{result.id}
+
+**Пользователь:** {result.first_name or ''} {result.last_name or ''} (@{result.username or 'None'})
+**Telegram ID:** {result.telegram_id}
+**Тест:** {test.name} ({test.test_type})
+
+**Результаты:**
+- Общий балл: {result.total_score}/{result.max_score}
+- Процент: {result.percentage:.1f}%
+- Время начала: {result.started_at.strftime('%d.%m.%Y %H:%M:%S')}
+- Время завершения: {result.completed_at.strftime('%d.%m.%Y %H:%M:%S') if result.completed_at else 'Не завершен'}
+
+**Подозрительная активность:** {'Проверка не завершена' if result.analysis_status == 'pending' else ('Да' if result.is_suspicious else 'Нет')}
+"""
+
+    if result.suspicious_reasons:
+        yield f"**Причины:** {', '.join(result.suspicious_reasons)}\n"
+
+    yield "\n**Вопросы и ответы:**\n\n"
+
+    # Фрагменты одного результата собираются в список и склеиваются один раз
+    lines = []
+    for question in questions:
+        answer = answers_dict.get(question.id)
+        lines.append(f"**{question.order}. {question.question_text}**\n")
+        lines.append(f"- **Правильный ответ:** {question.correct_answer}\n")
+        if answer:
+            lines.append(f"- **Ответ кандидата:** {answer.answer_text}\n")
+            lines.append(f"- **Правильно:** {'Да' if answer.is_correct else 'Нет'}\n")
+            lines.append(f"- **Баллы:** {answer.points_earned}/{question.points}\n")
+            if answer.time_spent:
+                lines.append(f"- **Время ответа:** {answer.time_spent} сек\n")
+        else:
+            lines.append("- **Ответ кандидата:** Не отвечен\n")
+        lines.append("\n")
+    lines.append("---\n\n")
+
+    yield "".join(lines)
+
+
+def _results_json(rows: ExportRows) -> Iterable[Dict[str, Any]]:
+    for result in rows.results:
+        yield result_to_json(result, rows.tests[result.test_id], rows.questions.get(result.test_id, ()))
+
+
+def export_document(rows: ExportRows, export_date: datetime) -> Dict[str, Any]:
+    """JSON-документ выгрузки (как у ExportService.export_results)"""
+    return {
+        "export_date": export_date.isoformat(),
+        "total_results": len(rows.results),
+        "results": list(_results_json(rows))
+    }
+
+
+def markdown_results(rows: ExportRows) -> str:
+    """Разделы Markdown-отчета по результатам rows, без заголовка"""
+    parts = []
+    for result in rows.results:
+        parts.extend(result_to_markdown(result, rows.tests[result.test_id], rows.questions.get(result.test_id, ())))
+    return "".join(parts)
+
+
+def render_markdown(rows: ExportRows, export_date: datetime) -> str:
+    return markdown_header(export_date, len(rows.results)) + markdown_results(rows)
+
+
+def render_markdown_batch(rows: ExportRows) -> bytes:
+    """Пачка результатов потокового Markdown-отчета"""
+    return markdown_results(rows).encode("utf-8")
+
+
+def render_download(format: str, rows: ExportRows, export_date: datetime) -> bytes:
+    """Файл для скачивания: JSON с отступами (Markdown-отчет отдается потоком)"""
+    if format == "json":
+        return json.dumps(export_document(rows, export_date), indent=2, ensure_ascii=False).encode("utf-8")
+    raise ValueError("Unsupported format")
+
+
+def render_response(format: str, rows: ExportRows, export_date: datetime, filename: str) -> bytes:
+    """Тело ответа POST /export (ExportResponse) в компактном JSON"""
+    if format == "markdown":
+        data = {"content": render_markdown(rows, export_date)}
+    elif format == "json":
+        data = export_document(rows, export_date)
+    else:
+        raise ValueError("Unsupported format")
+    return json.dumps(
+        {"data": data, "format": format, "filename": filename},
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
@@ -1,40 +1,146 @@
+import itertools
+import os
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.database import get_db
-from app.schemas import TestResult as TestResultSchema, ExportRequest, ExportResponse
-from app.services import ExportService
+from app.database import get_db, SessionLocal
+from app.models import TestResult, ExportJob
+from app.schemas import (
+    TestResult as TestResultSchema, TestResultPage, TestStats, ExportRequest, ExportResponse,
+    ExportChangesResponse, ExportJobCreate, ExportJob as ExportJobSchema
+)
+from app.services import ExportService, StatisticsService, TestResultService
+from app.exports import export_queue, export_render_pool, ExportPoolSaturated, ExportPoolUnavailable
+from app.config import settings
+from app.cache import export_cache
 
 router = APIRouter(prefix="/api/results", tags=["results"])
 
 
-@router.get("/", response_model=List[TestResultSchema])
+def _stream_with_session(render, **kwargs):
+    """Генератор экспорта со своей сессией: запрос живет, пока отдается ответ"""
+    db = SessionLocal()
+    try:
+        yield from render(db, **kwargs)
+    finally:
+        db.close()
+
+
+def _cached_export_response(db: Session, kind: str, format: str, **filters) -> Response:
+    """Потоковая выгрузка через кэш: повторный запрос с теми же фильтрами
+    до новых отправок отдается из памяти без обращения к данным"""
+    media_type, _ = ExportService.export_format_info(format)
+    filename = ExportService.export_filename(kind, format)
+    key = ExportService.cache_key(db, kind, format, **filters)
+    body = export_cache.get(key)
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "X-Export-Cache": "hit" if body is not None else "miss"
+    }
+    if body is not None:
+        return Response(content=body, media_type=media_type, headers=headers)
+    return StreamingResponse(
+        export_cache.tee(key, _stream_with_session(ExportService.render_export, format=format, **filters)),
+        media_type=media_type,
+        headers=headers
+    )
+
+
+def _export_pool_saturated() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many concurrent exports, retry later or use POST /api/results/export/jobs",
+        headers={"Retry-After": str(settings.export_retry_after_seconds)}
+    )
+
+
+def _export_pool_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Export workers are unavailable, retry later or use POST /api/results/export/jobs",
+        headers={"Retry-After": str(settings.export_retry_after_seconds)}
+    )
+
+
+def _answers_export_response(db: Session, format: str, **filters) -> Response:
+    """Потоковая плоская выгрузка ответов (CSV / NDJSON в gzip)"""
+    return _cached_export_response(db, "answers", format, **filters)
+
+
+def _export_job_response(job: ExportJob) -> ExportJobSchema:
+    rows_written = export_queue.rows_written(job)
+    if job.status == "done":
+        progress = 1.0
+    elif job.total_rows:
+        progress = min(rows_written / job.total_rows, 1.0)
+    else:
+        progress = 0.0 if job.total_rows == 0 else None
+    return ExportJobSchema(
+        id=job.id,
+        format=job.format,
+        status=job.status,
+        filters=job.filters,
+        rows_written=rows_written,
+        total_rows=job.total_rows,
+        progress=progress,
+        file_size=job.file_size,
+        error=job.error,
+        created_at=job.created_at,
+        completed_at=job.completed_at,
+        expires_at=job.expires_at,
+        download_url=f"{router.prefix}/export/jobs/{job.id}/download" if job.status == "done" else None
+    )
+
+
+@router.get("/", response_model=TestResultPage)
 def get_results(
     db: Session = Depends(get_db),
     test_id: Optional[int] = None,
-    include_suspicious: bool = True
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    is_suspicious: Optional[bool] = None,
+    include_suspicious: bool = True,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None
 ):
-    """Получить результаты тестов (для админов)"""
+    """Получить результаты тестов постранично (для админов)"""
     # В реальном проекте здесь должна быть проверка авторизации
     
-    query = db.query(TestResultSchema)
-    
-    if test_id:
-        query = query.filter(TestResultSchema.test_id == test_id)
+    if not include_suspicious and is_suspicious is None:
+        is_suspicious = False
     
-    if not include_suspicious:
-        query = query.filter(TestResultSchema.is_suspicious == False)
+    try:
+        results, next_cursor = TestResultService.list_results(
+            db,
+            limit=limit,
+            cursor=cursor,
+            test_id=test_id,
+            date_from=date_from,
+            date_to=date_to,
+            is_suspicious=is_suspicious
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    results = query.all()
-    return results
+    return TestResultPage(items=results, next_cursor=next_cursor)
+
+
+@router.get("/stats", response_model=List[TestStats])
+def get_results_stats(
+    test_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Статистика результатов по тестам из инкрементальных агрегатов"""
+    return StatisticsService.get_stats(db, test_id)
 
 
 @router.get("/{result_id}", response_model=TestResultSchema)
 def get_result(result_id: int, db: Session = Depends(get_db)):
     """Получить конкретный результат теста"""
-    result = db.query(TestResultSchema).filter(TestResultSchema.id == result_id).first()
+    result = db.query(TestResult).filter(TestResult.id == result_id).first()
     if not result:
         raise HTTPException(status_code=404, detail="Result not found")
     return result
@@ -45,34 +151,42 @@ def export_results(
     export_request: ExportRequest,
     db: Session = Depends(get_db)
 ):
-    """Экспорт результатов в JSON или Markdown"""
+    """Экспорт результатов в JSON или Markdown; CSV и NDJSON (gzip) отдаются файлом"""
+    filters = dict(
+        test_id=export_request.test_id,
+        date_from=export_request.date_from,
+        date_to=export_request.date_to,
+        include_suspicious=export_request.include_suspicious
+    )
+    if export_request.format in ExportService.ANSWER_EXPORT_FORMATS:
+        return _answers_export_response(db, export_request.format, **filters)
+    
+    # Готовый ответ кэшируется целиком, повтор до новых отправок не трогает данные
+    key = ExportService.cache_key(db, "export", export_request.format, **filters)
+    body = export_cache.get(key)
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers={"X-Export-Cache": "hit"})
+    
+    if export_request.format == "markdown":
+        filename = ExportService.markdown_filename()
+    else:
+        filename = f"quantum_insight_results_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    
+    # Рендеринг - в пуле процессов; одновременных выгрузок не больше export_max_concurrent
     try:
-        export_data = ExportService.export_results(
-            db=db,
-            format=export_request.format,
-            test_id=export_request.test_id,
-            date_from=export_request.date_from,
-            date_to=export_request.date_to,
-            include_suspicious=export_request.include_suspicious
-        )
-        
-        if export_request.format == "markdown":
-            return ExportResponse(
-                data={"content": export_data["content"]},
-                format="markdown",
-                filename=export_data["filename"]
-            )
-        else:
-            return ExportResponse(
-                data=export_data,
-                format="json",
-                filename=f"quantum_insight_results_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
-            )
-            
+        with export_render_pool.slot():
+            body = export_render_pool.render_response(db, export_request.format, filename, **filters)
+    except ExportPoolSaturated:
+        raise _export_pool_saturated()
+    except ExportPoolUnavailable:
+        raise _export_pool_unavailable()
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Export failed")
+    
+    export_cache.put(key, body)
+    return Response(content=body, media_type="application/json", headers={"X-Export-Cache": "miss"})
 
 
 @router.get("/export/download/{format}")
@@ -82,31 +196,138 @@ def download_export(
     db: Session = Depends(get_db)
 ):
     """Скачать экспорт результатов"""
+    if format in ExportService.ANSWER_EXPORT_FORMATS:
+        return _answers_export_response(db, format, test_id=test_id)
+    
     if format not in ["json", "markdown"]:
         raise HTTPException(status_code=400, detail="Unsupported format")
     
-    try:
-        export_data = ExportService.export_results(
-            db=db,
-            format=format,
-            test_id=test_id
-        )
-        
-        if format == "markdown":
-            content = export_data["content"]
-            filename = export_data["filename"]
-            media_type = "text/markdown"
-        else:
-            import json
-            content = json.dumps(export_data, indent=2, ensure_ascii=False)
-            filename = f"quantum_insight_results_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
-            media_type = "application/json"
-        
-        return Response(
-            content=content,
+    media_type, extension = ExportService.export_format_info(format)
+    filename = f"quantum_insight_results_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    key = ExportService.cache_key(db, "download", format, test_id=test_id)
+    content = export_cache.get(key)
+    cache_status = "hit"
+    if content is None and format == "markdown":
+        # Markdown-отчет отдается потоком: пачки результатов рендерятся в пуле по мере отправки
+        chunks = _stream_with_session(export_render_pool.stream_markdown, test_id=test_id)
+        try:
+            # Первый фрагмент занимает слот - переполнение видно до начала ответа
+            header = next(chunks)
+        except ExportPoolSaturated:
+            raise _export_pool_saturated()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Export failed")
+        return StreamingResponse(
+            export_cache.tee(key, itertools.chain([header], chunks)),
             media_type=media_type,
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            headers={"Content-Disposition": f"attachment; filename={filename}", "X-Export-Cache": "miss"}
         )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Export failed") 
\ No newline at end of file
+    if content is None:
+        cache_status = "miss"
+        # Рендеринг - в пуле процессов; одновременных выгрузок не больше export_max_concurrent
+        try:
+            with export_render_pool.slot():
+                content = export_render_pool.render_download(db, format, test_id=test_id)
+        except ExportPoolSaturated:
+            raise _export_pool_saturated()
+        except ExportPoolUnavailable:
+            raise _export_pool_unavailable()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Export failed")
+        export_cache.put(key, content)
+    
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Export-Cache": cache_status}
+    )
+
+
+@router.get("/export/changes", response_model=ExportChangesResponse)
+def export_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    test_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Инкрементальная выгрузка: результаты, созданные или измененные после водяного знака since.
+    Возвращает новый водяной знак; при has_more следующую порцию нужно запросить сразу."""
+    try:
+        return ExportService.export_changes(db, since=since, limit=limit, test_id=test_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/export/stream/{format}")
+def stream_export(
+    format: str,
+    test_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    include_suspicious: bool = True,
+    db: Session = Depends(get_db)
+):
+    """Потоковый экспорт результатов в JSON или NDJSON без загрузки всего набора в память;
+    csv и ndjson_gz - плоская выгрузка по одной строке на ответ"""
+    filters = dict(
+        test_id=test_id,
+        date_from=date_from,
+        date_to=date_to,
+        include_suspicious=include_suspicious
+    )
+    if format in ExportService.ANSWER_EXPORT_FORMATS:
+        return _answers_export_response(db, format, **filters)
+    
+    if format not in ["json", "ndjson"]:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    
+    return _cached_export_response(db, "results", format, **filters)
+
+
+@router.post("/export/jobs", response_model=ExportJobSchema, status_code=202)
+def create_export_job(
+    export_request: ExportJobCreate,
+    db: Session = Depends(get_db)
+):
+    """Поставить выгрузку в очередь; файл скачивается по download_url после завершения"""
+    job = export_queue.create_job(
+        db,
+        export_request.format,
+        test_id=export_request.test_id,
+        date_from=export_request.date_from,
+        date_to=export_request.date_to,
+        include_suspicious=export_request.include_suspicious
+    )
+    # Без воркеров (export_workers = 0) выгрузка выполняется прямо в запросе
+    export_queue.enqueue(job.id)
+    db.refresh(job)
+    return _export_job_response(job)
+
+
+@router.get("/export/jobs/{job_id}", response_model=ExportJobSchema)
+def get_export_job(job_id: int, db: Session = Depends(get_db)):
+    """Статус и прогресс фоновой выгрузки"""
+    job = db.get(ExportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return _export_job_response(job)
+
+
+@router.get("/export/jobs/{job_id}/download")
+def download_export_job(job_id: int, db: Session = Depends(get_db)):
+    """Файл готовой выгрузки; поддерживает Range-запросы для докачки"""
+    job = db.get(ExportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status == "expired" or (job.status == "done" and not os.path.exists(job.file_path)):
+        raise HTTPException(status_code=410, detail="Export artifact expired")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    
+    media_type, extension = ExportService.export_format_info(job.format)
+    # FileResponse отдает Content-Length, Accept-Ranges и отвечает 206 на Range-запросы
+    return FileResponse(
+        job.file_path,
+        media_type=media_type,
+        filename=f"quantum_insight_export_{job.id}.{extension}"
+    )
@@ -1,19 +1,71 @@
+import logging
+
 from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
-from app.database import get_db
-from app.schemas import TestSubmission, TestSubmissionResponse
-from app.services import TestResultService, UserService
+from app.analysis import analysis_queue
+from app.async_database import get_async_db
+from app.async_services import AsyncTestResultService, AsyncUserService
+from app.ranking import score_ranking
+from app.schemas import (
+    TestSubmission, TestSubmissionResponse, BulkSubmissionRequest, BulkSubmissionResponse,
+    BulkSubmissionItemResult
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/submissions", tags=["submissions"])
 
 
+@router.post("/bulk", response_model=BulkSubmissionResponse)
+async def submit_bulk(
+    request: BulkSubmissionRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Пакетная отправка ответов (импорт, синхронизация офлайн-клиентов)"""
+    outcomes = await AsyncTestResultService.submit_bulk(db, request.items)
+    saved = [outcome for outcome in outcomes if outcome["success"]]
+    
+    # Анализ и перцентили - после коммита всего пакета, как и при одиночной отправке
+    if analysis_queue.is_inline:
+        await run_in_threadpool(lambda: [analysis_queue.enqueue(outcome["result_id"]) for outcome in saved])
+    else:
+        for outcome in saved:
+            analysis_queue.enqueue(outcome["result_id"])
+    
+    def record_percentiles(session):
+        for outcome in saved:
+            try:
+                outcome["percentile"] = score_ranking.record_result(
+                    session, outcome["test_id"], outcome["percentage"]
+                )
+            except Exception:
+                # Результат уже сохранен - без перцентиля элемент все равно успешный
+                logger.exception("Percentile for result %s failed", outcome["result_id"])
+                outcome["percentile"] = None
+    
+    await db.run_sync(record_percentiles)
+    
+    return BulkSubmissionResponse(
+        total=len(outcomes),
+        succeeded=len(saved),
+        failed=len(outcomes) - len(saved),
+        results=[
+            BulkSubmissionItemResult(**{
+                key: value for key, value in outcome.items() if key != "test_id"
+            })
+            for outcome in outcomes
+        ]
+    )
+
+
 @router.post("/{test_id}/submit", response_model=TestSubmissionResponse)
-def submit_test(
+async def submit_test(
     test_id: int,
     submission: TestSubmission,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     x_telegram_user_id: Optional[int] = Header(None),
     x_telegram_username: Optional[str] = Header(None),
     x_telegram_first_name: Optional[str] = Header(None),
@@ -29,7 +81,7 @@ def submit_test(
     if not x_telegram_user_id:
         raise HTTPException(status_code=400, detail="Telegram user ID required")
     
-    user = UserService.get_or_create_user(
+    user_id = await AsyncUserService.get_or_create_user_id(
         db=db,
         telegram_id=x_telegram_user_id,
         username=x_telegram_username,
@@ -39,7 +91,22 @@ def submit_test(
     
     try:
         # Отправляем тест
-        result = TestResultService.submit_test(db, submission, user.id)
+        result = await AsyncTestResultService.submit_test(db, submission, user_id)
+        
+        # Анализ подозрительной активности идет в фоне и не задерживает ответ
+        if analysis_queue.is_inline:
+            # Синхронный анализ не должен блокировать event loop
+            await run_in_threadpool(analysis_queue.enqueue, result.id)
+            await db.refresh(result)
+        else:
+            analysis_queue.enqueue(result.id)
+        
+        try:
+            percentile = await db.run_sync(score_ranking.record_result, result.test_id, result.percentage)
+        except Exception:
+            # Результат уже сохранен - без перцентиля ответ все равно успешный
+            logger.exception("Percentile for result %s failed", result.id)
+            percentile = None
         
         return TestSubmissionResponse(
             result_id=result.id,
@@ -47,6 +114,8 @@ def submit_test(
             max_score=result.max_score,
             percentage=result.percentage,
             is_suspicious=result.is_suspicious,
+            analysis_status=result.analysis_status,
+            percentile=percentile,
             message="Тест успешно завершен! Результаты отправлены команде QIP."
         )
         
@@ -1,38 +1,57 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.async_database import get_async_db
+from app.async_services import AsyncTestService
+from app.cache import CatalogEntry
 from app.models import Test, Question
 from app.schemas import Test as TestSchema, Question as QuestionSchema
-from app.services import TestService
 
 router = APIRouter(prefix="/api/tests", tags=["tests"])
 
 
+def _catalog_response(entry: CatalogEntry, if_none_match: Optional[str]) -> Response:
+    """Ответ из кэша каталога с ETag; 304, если у клиента актуальная версия"""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
 @router.get("/", response_model=List[TestSchema])
-def get_tests(db: Session = Depends(get_db)):
+async def get_tests(
+    db: AsyncSession = Depends(get_async_db),
+    if_none_match: Optional[str] = Header(None)
+):
     """Получить список активных тестов"""
-    tests = TestService.get_active_tests(db)
-    return tests
+    entry = await AsyncTestService.get_active_tests_cached(db)
+    return _catalog_response(entry, if_none_match)
 
 
 @router.get("/{test_id}", response_model=TestSchema)
-def get_test(test_id: int, db: Session = Depends(get_db)):
+async def get_test(
+    test_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    if_none_match: Optional[str] = Header(None)
+):
     """Получить конкретный тест"""
-    test = TestService.get_test_by_id(db, test_id)
-    if not test:
+    entry = await AsyncTestService.get_test_by_id_cached(db, test_id)
+    if not entry:
         raise HTTPException(status_code=404, detail="Test not found")
-    return test
+    return _catalog_response(entry, if_none_match)
 
 
 @router.get("/{test_id}/questions", response_model=List[QuestionSchema])
-def get_test_questions(test_id: int, db: Session = Depends(get_db)):
+async def get_test_questions(
+    test_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    if_none_match: Optional[str] = Header(None)
+):
     """Получить вопросы теста"""
     # Проверяем существование теста
-    test = TestService.get_test_by_id(db, test_id)
-    if not test:
+    if not await AsyncTestService.get_test_by_id_cached(db, test_id):
         raise HTTPException(status_code=404, detail="Test not found")
     
-    questions = TestService.get_test_questions(db, test_id)
-    return questions 
\ No newline at end of file
+    entry = await AsyncTestService.get_test_questions_cached(db, test_id)
+    return _catalog_response(entry, if_none_match)
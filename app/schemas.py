@@ -56,6 +56,8 @@ class QuestionBase(BaseModel):
 
 class QuestionCreate(QuestionBase):
     test_id: int
+    correct_answer: Optional[str] = None
+    accepted_answers: Optional[List[str]] = None
 
 
 class Question(QuestionBase):
@@ -108,12 +110,18 @@ class TestResult(TestResultBase):
     percentage: float
     is_suspicious: bool
     suspicious_reasons: Optional[List[str]] = None
+    analysis_status: Optional[str] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
 
 
+class TestResultPage(BaseModel):
+    items: List[TestResult]
+    next_cursor: Optional[str] = None  # None - это последняя страница
+
+
 # Test submission schemas
 class TestSubmission(BaseModel):
     test_id: int
@@ -127,12 +135,62 @@ class TestSubmissionResponse(BaseModel):
     max_score: float
     percentage: float
     is_suspicious: bool
+    analysis_status: str  # 'pending' - проверка на подозрительную активность еще идет
+    percentile: Optional[float] = None  # лучше, чем X% остальных кандидатов этого теста
     message: str
 
 
+class BulkSubmissionItem(BaseModel):
+    telegram_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    submission: TestSubmission
+
+
+class BulkSubmissionRequest(BaseModel):
+    items: List[BulkSubmissionItem] = Field(..., min_length=1, max_length=1000)
+
+
+class BulkSubmissionItemResult(BaseModel):
+    index: int
+    success: bool
+    result_id: Optional[int] = None
+    total_score: Optional[float] = None
+    max_score: Optional[float] = None
+    percentage: Optional[float] = None
+    percentile: Optional[float] = None
+    error: Optional[str] = None
+
+
+class BulkSubmissionResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BulkSubmissionItemResult]
+
+
+# Statistics schemas
+class QuestionStats(BaseModel):
+    question_id: int
+    answered_count: int
+    correct_count: int
+    correct_rate: float
+
+
+class TestStats(BaseModel):
+    test_id: int
+    result_count: int
+    mean_percentage: float
+    stddev_percentage: float
+    histogram: List[int]  # 10 корзин по 10%
+    suspicious_count: int
+    questions: List[QuestionStats]
+
+
 # Export schemas
 class ExportRequest(BaseModel):
-    format: str = Field(..., pattern="^(json|markdown)$")
+    format: str = Field(..., pattern="^(json|markdown|csv|ndjson_gz)$")
     test_id: Optional[int] = None
     date_from: Optional[datetime] = None
     date_to: Optional[datetime] = None
@@ -145,6 +203,37 @@ class ExportResponse(BaseModel):
     filename: str
 
 
+class ExportChangesResponse(BaseModel):
+    results: List[Dict[str, Any]]
+    count: int
+    watermark: Optional[str] = None  # передать как since в следующий запрос
+    has_more: bool
+
+
+class ExportJobCreate(BaseModel):
+    format: str = Field(..., pattern="^(json|ndjson|markdown|csv|ndjson_gz)$")
+    test_id: Optional[int] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    include_suspicious: bool = True
+
+
+class ExportJob(BaseModel):
+    id: int
+    format: str
+    status: str
+    filters: Optional[Dict[str, Any]] = None
+    rows_written: int
+    total_rows: Optional[int] = None
+    progress: Optional[float] = None  # 0..1, None - объем еще не посчитан
+    file_size: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    download_url: Optional[str] = None
+
+
 # Suspicious Activity schemas
 class SuspiciousActivityBase(BaseModel):
     activity_type: str
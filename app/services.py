@@ -1,30 +1,242 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Iterable, Iterator, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import and_, bindparam, case, func, insert, or_, select, text, tuple_, union_all
+import base64
+import csv
+import hashlib
+import io
 import json
+import math
 import re
+import zlib
 
-from app.models import User, Test, Question, TestResult, Answer, SuspiciousActivity
-from app.schemas import UserCreate, TestSubmission, TestResultCreate
+from app.models import (
+    User, Test, Question, TestResult, Answer, SuspiciousActivity, AnswerFingerprint, AnalysisJob,
+    TestStatistics, TestScoreBucket, QuestionStatistics, AnswerSignature, AnswerLshBucket, LshIndexState
+)
+from app.schemas import UserCreate, TestSubmission, TestResultCreate, BulkSubmissionItem
+from app.schemas import Test as TestSchema, Question as QuestionSchema
+from app.cache import catalog_cache, identity_cache, export_cache, CatalogEntry
+from app.metrics import metrics
+from app.grading import grading_cache, normalize_answer, CompiledQuestion
+from app.config import settings
+from app import minhash, rendering
+from app.rendering import AnswerRow, ExportRows, QuestionRow, ResultRow, TestRow
+from pydantic import TypeAdapter
+
+
+_tests_adapter = TypeAdapter(List[TestSchema])
+_test_adapter = TypeAdapter(TestSchema)
+_questions_adapter = TypeAdapter(List[QuestionSchema])
+
+
+def _dump_json(adapter: TypeAdapter, obj) -> bytes:
+    return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _report_progress(items: Iterable, progress: Optional[Callable[[int], None]],
+                     weight: Callable[[Any], int] = lambda item: 1) -> Iterable:
+    """Передает в progress число обработанных строк по мере обхода items"""
+    if progress is None:
+        return items
+    
+    def iterate():
+        done = 0
+        for item in items:
+            yield item
+            done += weight(item)
+            progress(done)
+    
+    return iterate()
+
+
+def _dialect_insert(db: Session, model):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта (None, если не поддерживается)"""
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(model)
+
+
+def _comparable_timestamp(db: Session, value):
+    """Время для keyset-сравнения и сортировки. SQLite хранит время строкой: func.now()
+    пишет 'YYYY-MM-DD HH:MM:SS', ORM - с микросекундами, и строки одной секунды сравниваются
+    неверно. strftime приводит обе стороны к одному формату (до миллисекунд, при равенстве
+    порядок задает id); на SQLite индекс по времени при этом не используется."""
+    if db.get_bind().dialect.name == "sqlite":
+        return func.strftime("%Y-%m-%d %H:%M:%f", value)
+    return value
+
+
+def _increment_counters(db: Session, model, key_columns: List[str],
+                        rows: List[Dict[str, Any]], counter_columns: List[str]) -> None:
+    """Атомарно прибавляет счетчики к строкам model по ключу (upsert одним запросом)"""
+    totals: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        key = tuple(row[column] for column in key_columns)
+        total = totals.get(key)
+        if total is None:
+            totals[key] = dict(row)
+        else:
+            for column in counter_columns:
+                total[column] += row[column]
+    
+    if not totals:
+        return
+    
+    stmt = _dialect_insert(db, model)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={
+                column: getattr(model, column) + getattr(stmt.excluded, column)
+                for column in counter_columns
+            }
+        )
+        db.execute(stmt, list(totals.values()))
+        return
+    
+    # Диалект без ON CONFLICT - обновляем существующие строки и добавляем недостающие
+    key_attrs = [getattr(model, column) for column in key_columns]
+    existing = {
+        tuple(getattr(obj, column) for column in key_columns): obj
+        for obj in db.query(model).filter(tuple_(*key_attrs).in_(list(totals)))
+    }
+    for key, total in totals.items():
+        obj = existing.get(key)
+        if obj is None:
+            db.add(model(**total))
+            continue
+        for column in counter_columns:
+            setattr(obj, column, getattr(model, column) + total[column])
+    db.flush()
+
+
+def _user_upsert(db: Session):
+    """Upsert пользователя по telegram_id (None, если диалект не поддерживает ON CONFLICT).
+    Пустые поля не затирают уже известные данные пользователя."""
+    stmt = _dialect_insert(db, User)
+    if stmt is None:
+        return None
+    set_ = {
+        column: func.coalesce(getattr(stmt.excluded, column), getattr(User, column))
+        for column in ("username", "first_name", "last_name")
+    }
+    # onupdate в ON CONFLICT DO UPDATE не применяется; updated_at меняется только
+    # при смене данных (по нему определяется версия выгрузок)
+    changed = or_(*(value.is_distinct_from(getattr(User, column)) for column, value in set_.items()))
+    set_["updated_at"] = case((changed, func.now()), else_=User.updated_at)
+    return stmt.on_conflict_do_update(index_elements=["telegram_id"], set_=set_)
 
 
 class UserService:
     @staticmethod
     def get_or_create_user(db: Session, telegram_id: int, username: str = None, 
                           first_name: str = None, last_name: str = None) -> User:
-        user = db.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            user = User(
-                telegram_id=telegram_id,
-                username=username,
-                first_name=first_name,
-                last_name=last_name
+        user_id = UserService.get_or_create_user_id(db, telegram_id, username, first_name, last_name)
+        return db.get(User, user_id)
+    
+    @staticmethod
+    def get_or_create_user_id(db: Session, telegram_id: int, username: str = None,
+                              first_name: str = None, last_name: str = None) -> int:
+        """id пользователя по telegram_id; повторные пользователи с теми же
+        данными обходятся без запросов к базе"""
+        cached = identity_cache.get(telegram_id)
+        if cached is not None:
+            user_id, *known = cached
+            # Пустое поле не меняет сохраненное значение (как и в upsert)
+            if all(new is None or new == old for new, old in zip((username, first_name, last_name), known)):
+                return user_id
+        
+        stmt = _user_upsert(db)
+        if stmt is not None:
+            # Одна атомарная команда: одновременные первые отправки не конфликтуют
+            row = db.connection().execute(
+                stmt.values(
+                    telegram_id=telegram_id,
+                    username=username,
+                    first_name=first_name,
+                    last_name=last_name
+                ).returning(User.id, User.username, User.first_name, User.last_name)
+            ).one()
+        else:
+            user = db.query(User).filter(User.telegram_id == telegram_id).first()
+            if not user:
+                user = User(telegram_id=telegram_id)
+                db.add(user)
+            for column, value in (("username", username), ("first_name", first_name), ("last_name", last_name)):
+                if value is not None:
+                    setattr(user, column, value)
+            db.flush()
+            row = (user.id, user.username, user.first_name, user.last_name)
+        db.commit()
+        
+        # Кэшируем только после коммита - в кэше лишь существующие пользователи
+        identity_cache.put(telegram_id, tuple(row))
+        return row[0]
+    
+    @staticmethod
+    def get_or_create_users(db: Session, identities: List[Dict[str, Any]]) -> Dict[int, int]:
+        """Находит или создает пользователей одним upsert, возвращает {telegram_id: user_id}
+        (без коммита). Пользователей, которых не удалось записать, в ответе нет."""
+        # Одинаковый набор ключей у всех строк - один executemany вместо группы запросов
+        rows = {
+            identity["telegram_id"]: {
+                "telegram_id": identity["telegram_id"],
+                "username": identity.get("username"),
+                "first_name": identity.get("first_name"),
+                "last_name": identity.get("last_name")
+            }
+            for identity in identities
+        }
+        if not rows:
+            return {}
+        
+        stmt = _user_upsert(db)
+        
+        def upsert(batch):
+            with db.begin_nested():
+                if stmt is not None:
+                    db.connection().execute(stmt, batch)
+                    return
+                existing = {
+                    telegram_id
+                    for (telegram_id,) in db.query(User.telegram_id).filter(
+                        User.telegram_id.in_([row["telegram_id"] for row in batch])
+                    )
+                }
+                db.add_all([User(**row) for row in batch if row["telegram_id"] not in existing])
+                db.flush()
+        
+        try:
+            upsert(list(rows.values()))
+        except SQLAlchemyError:
+            # Пакет целиком не записался - по одному, чтобы одна некорректная
+            # учетная запись не отклоняла остальные
+            for row in rows.values():
+                try:
+                    upsert([row])
+                except SQLAlchemyError:
+                    pass
+        
+        return {
+            telegram_id: user_id
+            for user_id, telegram_id in db.query(User.id, User.telegram_id).filter(
+                User.telegram_id.in_(list(rows))
             )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        return user
+        }
 
 
 class TestService:
@@ -41,6 +253,29 @@ class TestService:
         return db.query(Question).filter(
             Question.test_id == test_id
         ).order_by(Question.order).all()
+    
+    # Кэшированные версии возвращают готовый JSON и его ETag
+    @staticmethod
+    def get_active_tests_cached(db: Session) -> CatalogEntry:
+        return catalog_cache.get_or_load(
+            ("tests",),
+            lambda: _dump_json(_tests_adapter, TestService.get_active_tests(db))
+        )
+    
+    @staticmethod
+    def get_test_by_id_cached(db: Session, test_id: int) -> Optional[CatalogEntry]:
+        def load():
+            test = TestService.get_test_by_id(db, test_id)
+            return _dump_json(_test_adapter, test) if test else None
+        
+        return catalog_cache.get_or_load(("test", test_id), load)
+    
+    @staticmethod
+    def get_test_questions_cached(db: Session, test_id: int) -> CatalogEntry:
+        return catalog_cache.get_or_load(
+            ("questions", test_id),
+            lambda: _dump_json(_questions_adapter, TestService.get_test_questions(db, test_id))
+        )
 
 
 class TestResultService:
@@ -56,314 +291,1321 @@ class TestResultService:
         db.refresh(test_result)
         return test_result
     
+    @staticmethod
+    def list_results(db: Session, limit: int, cursor: Optional[str] = None,
+                     test_id: Optional[int] = None,
+                     date_from: Optional[datetime] = None,
+                     date_to: Optional[datetime] = None,
+                     is_suspicious: Optional[bool] = None) -> Tuple[List[TestResult], Optional[str]]:
+        """Страница результатов, от новых к старым, с keyset-курсором по (created_at, id)"""
+        query = db.query(TestResult)
+        
+        if test_id:
+            query = query.filter(TestResult.test_id == test_id)
+        
+        if date_from:
+            query = query.filter(TestResult.created_at >= date_from)
+        
+        if date_to:
+            query = query.filter(TestResult.created_at <= date_to)
+        
+        if is_suspicious is not None:
+            query = query.filter(TestResult.is_suspicious == is_suspicious)
+        
+        created_at_key = _comparable_timestamp(db, TestResult.created_at)
+        if cursor:
+            created_at, result_id = TestResultService._decode_cursor(cursor)
+            query = query.filter(
+                tuple_(created_at_key, TestResult.id) < tuple_(_comparable_timestamp(db, created_at), result_id)
+            )
+        
+        # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+        results = query.order_by(
+            created_at_key.desc(), TestResult.id.desc()
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = TestResultService._encode_cursor(results[-1])
+        
+        return results, next_cursor
+    
+    @staticmethod
+    def _encode_cursor(result: TestResult) -> str:
+        raw = f"{result.created_at.isoformat()}|{result.id}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            created_at, result_id = raw.rsplit("|", 1)
+            return datetime.fromisoformat(created_at), int(result_id)
+        except (ValueError, UnicodeError):
+            raise ValueError("Invalid cursor")
+    
     @staticmethod
     def submit_test(db: Session, test_submission: TestSubmission, user_id: int) -> TestResult:
-        # Получаем тест
-        test = TestService.get_test_by_id(db, test_submission.test_id)
-        if not test:
+        # Тест и его вопросы берутся из кэша скомпилированных вопросов
+        test = grading_cache.get_test(db, test_submission.test_id)
+        if not test or not test.is_active:
             raise ValueError("Test not found")
         
-        # Создаем результат теста
+        test_result, answer_rows = TestResultService._grade_submission(test_submission, user_id, test.questions)
+        
+        # Коммит один на всю отправку вместе с заданием на анализ
+        TestResultService._save_results(db, [(test_result, answer_rows, test_submission.total_time)])
+        db.commit()
+        
+        return test_result
+    
+    @staticmethod
+    def submit_bulk(db: Session, items: List[BulkSubmissionItem]) -> List[Dict[str, Any]]:
+        """Пакетная отправка: пользователи - одним upsert, вопросы - одним запросом,
+        запись - пакетными вставками; ошибка одного элемента не откатывает остальные"""
+        outcomes = [{"index": index, "success": False, "error": None} for index in range(len(items))]
+        
+        tests = grading_cache.get_tests(db, [item.submission.test_id for item in items])
+        active_test_ids = {test_id for test_id, test in tests.items() if test.is_active}
+        
+        valid_indexes = []
+        for index, item in enumerate(items):
+            if item.submission.test_id in active_test_ids:
+                valid_indexes.append(index)
+            else:
+                outcomes[index]["error"] = "Test not found"
+        
+        if not valid_indexes:
+            return outcomes
+        
+        user_ids = UserService.get_or_create_users(db, [
+            {
+                "telegram_id": items[index].telegram_id,
+                "username": items[index].username,
+                "first_name": items[index].first_name,
+                "last_name": items[index].last_name
+            }
+            for index in valid_indexes
+        ])
+        
+        for index in valid_indexes:
+            if items[index].telegram_id not in user_ids:
+                outcomes[index]["error"] = "User error"
+        valid_indexes = [index for index in valid_indexes if items[index].telegram_id in user_ids]
+        if not valid_indexes:
+            db.commit()
+            return outcomes
+        
+        def grade(index):
+            item = items[index]
+            test_result, answer_rows = TestResultService._grade_submission(
+                item.submission,
+                user_ids[item.telegram_id],
+                tests[item.submission.test_id].questions
+            )
+            return test_result, answer_rows, item.submission.total_time
+        
+        def mark_saved(index, entry):
+            test_result = entry[0]
+            outcomes[index].update({
+                "success": True,
+                "result_id": test_result.id,
+                "test_id": test_result.test_id,
+                "total_score": test_result.total_score,
+                "max_score": test_result.max_score,
+                "percentage": test_result.percentage
+            })
+        
+        graded = [(index, grade(index)) for index in valid_indexes]
+        try:
+            with db.begin_nested():
+                TestResultService._save_results(db, [entry for _, entry in graded])
+            for index, entry in graded:
+                mark_saved(index, entry)
+        except SQLAlchemyError:
+            # Пакет целиком не записался - пишем по одному, каждый в своей точке сохранения
+            for index in valid_indexes:
+                entry = grade(index)
+                try:
+                    with db.begin_nested():
+                        TestResultService._save_results(db, [entry])
+                    mark_saved(index, entry)
+                except SQLAlchemyError:
+                    outcomes[index]["error"] = "Database error"
+        
+        db.commit()
+        return outcomes
+    
+    @staticmethod
+    def _grade_submission(test_submission: TestSubmission, user_id: int,
+                          questions: Dict[int, CompiledQuestion]) -> Tuple[TestResult, List[Dict[str, Any]]]:
+        """Проверка ответов в памяти по скомпилированным вопросам теста"""
+        now = datetime.utcnow()
         test_result = TestResult(
             user_id=user_id,
             test_id=test_submission.test_id,
-            started_at=datetime.utcnow(),
-            completed_at=datetime.utcnow()
+            started_at=now,
+            completed_at=now,
+            created_at=now
         )
-        db.add(test_result)
-        db.commit()
-        db.refresh(test_result)
         
-        # Обрабатываем ответы
         total_score = 0.0
         max_score = 0.0
+        answer_rows = []
         
         for answer_data in test_submission.answers:
-            question = db.query(Question).filter(Question.id == answer_data.question_id).first()
+            question = questions.get(answer_data.question_id)
             if not question:
                 continue
             
-            max_score += question.points
-            
-            # Проверяем правильность ответа
-            is_correct = TestResultService._check_answer_correctness(question, answer_data.answer_text)
+            # Проверяем правильность ответа; вопрос без эталона не входит в максимальный балл
+            is_correct = question.grade(answer_data.answer_text)
+            if is_correct is not None:
+                max_score += question.points
             points_earned = question.points if is_correct else 0.0
             total_score += points_earned
             
-            # Сохраняем ответ
-            answer = Answer(
-                test_result_id=test_result.id,
-                question_id=answer_data.question_id,
-                answer_text=answer_data.answer_text,
-                is_correct=is_correct,
-                points_earned=points_earned,
-                time_spent=answer_data.time_spent
-            )
-            db.add(answer)
+            answer_rows.append({
+                "question_id": answer_data.question_id,
+                "answer_text": answer_data.answer_text,
+                "answer_hash": TestResultService._answer_hash(answer_data.answer_text),
+                "is_correct": is_correct,
+                "points_earned": points_earned,
+                "time_spent": answer_data.time_spent
+            })
         
         # Вычисляем процент
         percentage = (total_score / max_score * 100) if max_score > 0 else 0
         
-        # Обновляем результат
         test_result.total_score = total_score
         test_result.max_score = max_score
         test_result.percentage = percentage
         
-        # Анализируем подозрительную активность
+        # Анализ подозрительной активности выполняется в фоне (app.analysis)
+        test_result.is_suspicious = False
+        test_result.analysis_status = "pending"
+        
+        return test_result, answer_rows
+    
+    @staticmethod
+    def _save_results(db: Session, graded: List[Tuple[TestResult, List[Dict[str, Any]], Optional[int]]]) -> None:
+        """Записывает проверенные результаты пакетно (без коммита)"""
+        # Результаты вставляются ORM ради id, ответы и задания - пакетными вставками
+        db.add_all([test_result for test_result, _, _ in graded])
+        db.flush()
+        
+        all_answer_rows = []
+        for test_result, answer_rows, _ in graded:
+            for row in answer_rows:
+                row["test_result_id"] = test_result.id
+            all_answer_rows.extend(answer_rows)
+        if all_answer_rows:
+            db.execute(insert(Answer), all_answer_rows)
+        
+        db.execute(insert(AnalysisJob), [
+            {"test_result_id": test_result.id, "payload": {"total_time": total_time}}
+            for test_result, _, total_time in graded
+        ])
+        
+        StatisticsService.record_results(db, [
+            (test_result.test_id, test_result.percentage, answer_rows)
+            for test_result, answer_rows, _ in graded
+        ])
+    
+    @staticmethod
+    def run_analysis(db: Session, job: AnalysisJob) -> TestResult:
+        """Анализ подозрительной активности по заданию из очереди (без коммита)"""
+        test_result = db.query(TestResult).filter(TestResult.id == job.test_result_id).first()
+        if not test_result:
+            raise ValueError("Test result not found")
+        
+        answer_rows = [
+            {
+                "answer_id": answer_id,
+                "question_id": question_id,
+                "answer_text": answer_text,
+                "answer_hash": answer_hash or TestResultService._answer_hash(answer_text),
+                "is_correct": is_correct
+            }
+            for answer_id, question_id, answer_text, answer_hash, is_correct in db.query(
+                Answer.id, Answer.question_id, Answer.answer_text, Answer.answer_hash, Answer.is_correct
+            ).filter(Answer.test_result_id == test_result.id)
+        ]
+        
+        activity_rows = []
         suspicious_reasons = TestResultService._analyze_suspicious_activity(
-            db, test_result, test_submission
+            db, answer_rows, (job.payload or {}).get("total_time"), activity_rows, test_result
         )
+        
+        if activity_rows:
+            for row in activity_rows:
+                row["test_result_id"] = test_result.id
+            db.execute(insert(SuspiciousActivity), activity_rows)
+        
+        # Счетчики отпечатков обновляются в порядке обработки заданий,
+        # чтобы каждый результат сравнивался только с уже проанализированными
+        TestResultService._update_answer_fingerprints(db, answer_rows)
+        
         test_result.is_suspicious = len(suspicious_reasons) > 0
         test_result.suspicious_reasons = suspicious_reasons
-        
-        db.commit()
-        db.refresh(test_result)
+        test_result.analysis_status = "done"
+        if test_result.is_suspicious:
+            StatisticsService.record_suspicious(db, test_result.test_id)
+        job.status = "done"
+        job.error = None
         
         return test_result
     
     @staticmethod
-    def _check_answer_correctness(question: Question, answer_text: str) -> bool:
-        if question.question_type == "multiple_choice":
-            return answer_text.strip().lower() == question.correct_answer.strip().lower()
-        else:
-            # Для текстовых ответов - простая проверка на совпадение
-            return answer_text.strip().lower() == question.correct_answer.strip().lower()
-    
-    @staticmethod
-    def _analyze_suspicious_activity(db: Session, test_result: TestResult, 
-                                   submission: TestSubmission) -> List[str]:
+    def _analyze_suspicious_activity(db: Session, answer_rows: List[Dict[str, Any]],
+                                   total_time: Optional[int],
+                                   activity_rows: List[Dict[str, Any]],
+                                   test_result: Optional[TestResult] = None) -> List[str]:
         reasons = []
         
         # Проверка на слишком быстрое прохождение
-        if submission.total_time and submission.total_time < 30:
+        if total_time and total_time < 30:
             reasons.append("too_fast_completion")
             
-            suspicious = SuspiciousActivity(
-                test_result_id=test_result.id,
-                activity_type="too_fast",
-                description=f"Test completed in {submission.total_time} seconds",
-                confidence_score=0.8,
-                details={"total_time": submission.total_time}
-            )
-            db.add(suspicious)
+            activity_rows.append({
+                "activity_type": "too_fast",
+                "description": f"Test completed in {total_time} seconds",
+                "confidence_score": 0.8,
+                "details": {"total_time": total_time}
+            })
         
         # Проверка на одинаковые ответы
-        identical_answers = TestResultService._check_identical_answers(db, test_result)
+        identical_answers = TestResultService._check_identical_answers(db, answer_rows)
         if identical_answers:
             reasons.append("identical_answers")
             
-            suspicious = SuspiciousActivity(
-                test_result_id=test_result.id,
-                activity_type="identical_answers",
-                description=f"Found {len(identical_answers)} identical answers",
-                confidence_score=0.7,
-                details={"identical_answers": identical_answers}
-            )
-            db.add(suspicious)
+            activity_rows.append({
+                "activity_type": "identical_answers",
+                "description": f"Found {len(identical_answers)} identical answers",
+                "confidence_score": 0.7,
+                "details": {"identical_answers": identical_answers}
+            })
+        
+        # Проверка на почти одинаковые текстовые ответы (MinHash/LSH)
+        if test_result is not None:
+            test = grading_cache.get_test(db, test_result.test_id)
+            text_rows = [
+                row for row in answer_rows
+                if test is not None and row["question_id"] in test.questions
+                and not test.questions[row["question_id"]].is_choice
+            ]
+            near_duplicates = NearDuplicateService.find_near_duplicates(db, test_result.id, text_rows)
+            if near_duplicates:
+                reasons.append("near_duplicate_answers")
+                
+                activity_rows.append({
+                    "activity_type": "near_duplicate_answers",
+                    "description": f"Found {len(near_duplicates)} near-duplicate answers",
+                    "confidence_score": max(match["similarity"] for match in near_duplicates),
+                    "details": {"near_duplicate_answers": near_duplicates}
+                })
         
         return reasons
     
     @staticmethod
-    def _check_identical_answers(db: Session, test_result: TestResult) -> List[Dict]:
+    def _answer_hash(answer_text: str) -> str:
+        """Хэш ответа в канонической форме проверки (normalize_answer): ответы,
+        одинаковые для проверки, считаются одинаковыми и при поиске совпадений"""
+        return hashlib.sha256(normalize_answer(answer_text).encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _check_identical_answers(db: Session, answer_rows: List[Dict[str, Any]]) -> List[Dict]:
         identical = []
         
-        current_answers = db.query(Answer).filter(
-            Answer.test_result_id == test_result.id
-        ).all()
+        if not answer_rows:
+            return identical
         
-        for current_answer in current_answers:
-            similar_answers = db.query(Answer).filter(
-                and_(
-                    Answer.test_result_id != test_result.id,
-                    Answer.question_id == current_answer.question_id,
-                    Answer.answer_text == current_answer.answer_text
-                )
-            ).all()
-            
-            if similar_answers:
+        # Один запрос по индексу (question_id, answer_hash) для всей отправки
+        keys = list({(row["question_id"], row["answer_hash"]) for row in answer_rows})
+        similar_counts = {
+            (question_id, answer_hash): answer_count
+            for question_id, answer_hash, answer_count in db.query(
+                AnswerFingerprint.question_id,
+                AnswerFingerprint.answer_hash,
+                AnswerFingerprint.answer_count
+            ).filter(
+                tuple_(AnswerFingerprint.question_id, AnswerFingerprint.answer_hash).in_(keys)
+            )
+        }
+        
+        for row in answer_rows:
+            similar_count = similar_counts.get((row["question_id"], row["answer_hash"]))
+            if similar_count:
                 identical.append({
-                    "question_id": current_answer.question_id,
-                    "answer_text": current_answer.answer_text,
-                    "similar_count": len(similar_answers)
+                    "question_id": row["question_id"],
+                    "answer_text": row["answer_text"],
+                    "similar_count": similar_count
                 })
         
         return identical
+    
+    @staticmethod
+    def _update_answer_fingerprints(db: Session, answer_rows: List[Dict[str, Any]]) -> None:
+        """Увеличивает счетчики отпечатков ответов в той же транзакции"""
+        _increment_counters(
+            db, AnswerFingerprint, ["question_id", "answer_hash"],
+            [
+                {"question_id": row["question_id"], "answer_hash": row["answer_hash"], "answer_count": 1}
+                for row in answer_rows
+            ],
+            ["answer_count"]
+        )
+    
+    @staticmethod
+    def rebuild_answer_fingerprints(db: Session, batch_size: int = 5000) -> int:
+        """Заполняет answer_hash у старых ответов и пересчитывает таблицу отпечатков"""
+        updated = 0
+        while True:
+            batch = db.query(Answer.id, Answer.answer_text).filter(
+                Answer.answer_hash.is_(None)
+            ).order_by(Answer.id).limit(batch_size).all()
+            if not batch:
+                break
+            
+            db.execute(
+                Answer.__table__.update().where(Answer.id == bindparam("answer_id")),
+                [
+                    {"answer_id": answer_id, "answer_hash": TestResultService._answer_hash(answer_text)}
+                    for answer_id, answer_text in batch
+                ]
+            )
+            db.commit()
+            updated += len(batch)
+        
+        db.query(AnswerFingerprint).delete()
+        db.execute(
+            insert(AnswerFingerprint).from_select(
+                ["question_id", "answer_hash", "answer_count"],
+                select(Answer.question_id, Answer.answer_hash, func.count(Answer.id)).group_by(
+                    Answer.question_id, Answer.answer_hash
+                )
+            )
+        )
+        db.commit()
+        return updated
 
 
-class ExportService:
+class NearDuplicateService:
+    """Поиск почти одинаковых текстовых ответов: MinHash-сигнатуры и LSH-корзины по вопросам.
+    
+    Сравнение идет только с ответами из общих корзин, поэтому стоимость не растет
+    линейно с историей ответов. Ответы, записанные до появления индекса, вносятся
+    в него лениво: при анализе - не больше CATCH_UP_BATCH ответов вопроса за раз
+    (полностью - scripts/rebuild_lsh_index.py).
+    """
+    CATCH_UP_BATCH = 2000
+    MAX_CANDIDATES_PER_BUCKET = 20
+    MAX_CANDIDATES_PER_ANSWER = 100
+    
     @staticmethod
-    def export_results(db: Session, format: str, test_id: Optional[int] = None,
-                      date_from: Optional[datetime] = None, 
-                      date_to: Optional[datetime] = None,
-                      include_suspicious: bool = True) -> Dict[str, Any]:
+    def find_near_duplicates(db: Session, test_result_id: int,
+                             answer_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Ищет похожие ответы из других результатов и вносит ответы результата
+        в индекс (без коммита). answer_rows - текстовые ответы с answer_id"""
+        signed = []
+        for row in answer_rows:
+            values = minhash.signature(row["answer_text"])
+            if values is not None:
+                signed.append((row, values))
+        if not signed:
+            return []
         
-        query = db.query(TestResult)
+        caught_up = NearDuplicateService._catch_up(
+            db, {row["question_id"] for row, _ in signed}, test_result_id
+        )
+        
+        # Засчитанные ответы близки к эталону и поэтому друг к другу - их не сравниваем
+        compared = [(row, values) for row, values in signed if not row.get("is_correct")]
+        
+        rows_by_key: Dict[tuple, List[int]] = {}
+        for row, values in compared:
+            for band, bucket_hash in enumerate(minhash.band_hashes(values)):
+                rows_by_key.setdefault((row["question_id"], band, bucket_hash), []).append(row["answer_id"])
+        
+        candidates: Dict[int, set] = {row["answer_id"]: set() for row, _ in compared}
+        if rows_by_key:
+            # Один запрос по всем корзинам всех ответов результата; свои ответы, точные
+            # совпадения (их учитывает проверка identical_answers) и засчитанные ответы
+            # отсекаются в базе, из корзины берутся не больше MAX_CANDIDATES_PER_BUCKET новейших
+            exact_keys = list({(row["question_id"], row["answer_hash"]) for row, _ in compared})
+            bucket_key = (AnswerLshBucket.question_id, AnswerLshBucket.band, AnswerLshBucket.bucket_hash)
+            ranked = select(
+                *bucket_key,
+                AnswerLshBucket.answer_id,
+                func.row_number().over(
+                    partition_by=bucket_key, order_by=AnswerLshBucket.answer_id.desc()
+                ).label("position")
+            ).join(Answer, Answer.id == AnswerLshBucket.answer_id).where(
+                tuple_(*bucket_key).in_(list(rows_by_key)),
+                Answer.test_result_id != test_result_id,
+                or_(Answer.answer_hash.is_(None), tuple_(Answer.question_id, Answer.answer_hash).not_in(exact_keys)),
+                or_(Answer.is_correct.is_(None), Answer.is_correct == False)
+            ).subquery()
+            for question_id, band, bucket_hash, answer_id in db.execute(
+                select(ranked.c.question_id, ranked.c.band, ranked.c.bucket_hash, ranked.c.answer_id).where(
+                    ranked.c.position <= NearDuplicateService.MAX_CANDIDATES_PER_BUCKET
+                )
+            ):
+                for own_answer_id in rows_by_key[(question_id, band, bucket_hash)]:
+                    if len(candidates[own_answer_id]) < NearDuplicateService.MAX_CANDIDATES_PER_ANSWER:
+                        candidates[own_answer_id].add(answer_id)
+        
+        matches = []
+        candidate_ids = set().union(*candidates.values())
+        if candidate_ids:
+            stored = {
+                answer_id: (result_id, minhash.from_bytes(data))
+                for answer_id, result_id, data in db.query(
+                    AnswerSignature.answer_id, AnswerSignature.test_result_id, AnswerSignature.signature
+                ).filter(AnswerSignature.answer_id.in_(list(candidate_ids)))
+            }
+            threshold = settings.near_duplicate_threshold
+            for row, values in compared:
+                best = None
+                for answer_id in candidates[row["answer_id"]]:
+                    candidate = stored.get(answer_id)
+                    if candidate is None:
+                        continue
+                    score = minhash.similarity(values, candidate[1])
+                    if score >= threshold and (best is None or score > best["similarity"]):
+                        best = {
+                            "question_id": row["question_id"],
+                            "answer_id": row["answer_id"],
+                            "matched_answer_id": answer_id,
+                            "matched_result_id": candidate[0],
+                            "similarity": score
+                        }
+                if best:
+                    matches.append(best)
+        
+        NearDuplicateService._index(db, [
+            (row["answer_id"], row["question_id"], test_result_id, values) for row, values in signed
+        ])
+        
+        # Ответы этого результата внесены - отметка сдвигается, если история вопроса уже догнана
+        watermarks = {}
+        for row, _ in signed:
+            question_id = row["question_id"]
+            if caught_up[question_id]:
+                watermarks[question_id] = max(watermarks.get(question_id, 0), row["answer_id"])
+        NearDuplicateService._advance_watermarks(db, watermarks)
+        
+        return matches
+    
+    @staticmethod
+    def _catch_up(db: Session, question_ids: Iterable[int], exclude_result_id: int) -> Dict[int, bool]:
+        """Вносит в индекс ответы выше отметки вопроса; возвращает, догнана ли история"""
+        question_ids = list(question_ids)
+        watermarks = {
+            question_id: last_answer_id
+            for question_id, last_answer_id in db.query(LshIndexState.question_id, LshIndexState.last_answer_id).filter(
+                LshIndexState.question_id.in_(question_ids)
+            )
+        }
+        
+        # Одним запросом: по пакету из CATCH_UP_BATCH ответов на каждый вопрос (UNION ALL
+        # подзапросов с LIMIT - каждый читает только свой пакет по порядку id)
+        batches = [
+            select(Answer.id, Answer.question_id, Answer.answer_text, Answer.test_result_id).outerjoin(
+                AnswerSignature, AnswerSignature.answer_id == Answer.id
+            ).where(
+                Answer.question_id == question_id,
+                Answer.id > watermarks.get(question_id, 0),
+                Answer.test_result_id != exclude_result_id,
+                AnswerSignature.id.is_(None)
+            ).order_by(Answer.id).limit(NearDuplicateService.CATCH_UP_BATCH).subquery()
+            for question_id in question_ids
+        ]
+        rows = db.execute(union_all(*(select(*batch.c) for batch in batches))).all() if batches else []
+        
+        entries = []
+        counts: Dict[int, int] = {}
+        advanced: Dict[int, int] = {}
+        for answer_id, question_id, answer_text, result_id in rows:
+            counts[question_id] = counts.get(question_id, 0) + 1
+            advanced[question_id] = max(advanced.get(question_id, 0), answer_id)
+            values = minhash.signature(answer_text)
+            if values is not None:
+                entries.append((answer_id, question_id, result_id, values))
+        NearDuplicateService._index(db, entries)
+        
+        caught_up = {
+            question_id: counts.get(question_id, 0) < NearDuplicateService.CATCH_UP_BATCH
+            for question_id in question_ids
+        }
+        NearDuplicateService._advance_watermarks(db, advanced)
+        return caught_up
+    
+    @staticmethod
+    def _index(db: Session, entries: List[Tuple[int, int, int, Any]]) -> None:
+        """Записывает сигнатуры и корзины; уже внесенные ответы пропускаются"""
+        if not entries:
+            return
+        
+        signature_rows = [
+            {
+                "answer_id": answer_id,
+                "question_id": question_id,
+                "test_result_id": result_id,
+                "signature": minhash.to_bytes(values)
+            }
+            for answer_id, question_id, result_id, values in entries
+        ]
+        bucket_rows = [
+            {"question_id": question_id, "band": band, "bucket_hash": bucket_hash, "answer_id": answer_id}
+            for answer_id, question_id, _, values in entries
+            for band, bucket_hash in enumerate(minhash.band_hashes(values))
+        ]
         
+        for model, rows in ((AnswerSignature, signature_rows), (AnswerLshBucket, bucket_rows)):
+            stmt = _dialect_insert(db, model)
+            if stmt is not None:
+                db.connection().execute(stmt.on_conflict_do_nothing(), rows)
+            else:
+                db.execute(insert(model), rows)
+    
+    @staticmethod
+    def _advance_watermarks(db: Session, watermarks: Dict[int, int]) -> None:
+        if not watermarks:
+            return
+        
+        rows = [
+            {"question_id": question_id, "last_answer_id": last_answer_id}
+            for question_id, last_answer_id in watermarks.items()
+        ]
+        stmt = _dialect_insert(db, LshIndexState)
+        if stmt is not None:
+            # Отметка только растет, даже при параллельных заданиях анализа
+            db.connection().execute(stmt.on_conflict_do_update(
+                index_elements=["question_id"],
+                set_={"last_answer_id": stmt.excluded.last_answer_id},
+                where=LshIndexState.last_answer_id < stmt.excluded.last_answer_id
+            ), rows)
+            return
+        
+        existing = {
+            state.question_id: state
+            for state in db.query(LshIndexState).filter(LshIndexState.question_id.in_(list(watermarks)))
+        }
+        for row in rows:
+            state = existing.get(row["question_id"])
+            if state is None:
+                db.add(LshIndexState(**row))
+            elif state.last_answer_id < row["last_answer_id"]:
+                state.last_answer_id = row["last_answer_id"]
+        db.flush()
+    
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Полностью перестраивает индекс по всем текстовым ответам"""
+        db.query(AnswerLshBucket).delete()
+        db.query(AnswerSignature).delete()
+        db.query(LshIndexState).delete()
+        db.commit()
+        
+        question_ids = [
+            question_id for (question_id,) in db.query(Question.id).filter(Question.question_type != "multiple_choice")
+        ]
+        for question_id in question_ids:
+            # История вопроса вносится пакетами по CATCH_UP_BATCH ответов
+            while not NearDuplicateService._catch_up(db, [question_id], exclude_result_id=0)[question_id]:
+                db.commit()
+            db.commit()
+        return db.query(func.count(AnswerSignature.id)).scalar()
+
+
+class StatisticsService:
+    HISTOGRAM_BUCKETS = 10
+    
+    @staticmethod
+    def _bucket(percentage: float) -> int:
+        return min(max(int(percentage // 10), 0), StatisticsService.HISTOGRAM_BUCKETS - 1)
+    
+    @staticmethod
+    def record_results(db: Session, results: List[Tuple[int, float, List[Dict[str, Any]]]]) -> None:
+        """Учитывает новые результаты (test_id, процент, ответы) в агрегатах тестов
+        в транзакции отправки - по одному upsert на таблицу"""
+        if not results:
+            return
+        
+        _increment_counters(
+            db, TestStatistics, ["test_id"],
+            [
+                {
+                    "test_id": test_id,
+                    "result_count": 1,
+                    "percentage_sum": percentage,
+                    "percentage_sq_sum": percentage * percentage,
+                    "suspicious_count": 0
+                }
+                for test_id, percentage, _ in results
+            ],
+            ["result_count", "percentage_sum", "percentage_sq_sum"]
+        )
+        _increment_counters(
+            db, TestScoreBucket, ["test_id", "bucket"],
+            [
+                {"test_id": test_id, "bucket": StatisticsService._bucket(percentage), "result_count": 1}
+                for test_id, percentage, _ in results
+            ],
+            ["result_count"]
+        )
+        _increment_counters(
+            db, QuestionStatistics, ["question_id"],
+            [
+                {
+                    "question_id": row["question_id"],
+                    "test_id": test_id,
+                    "answered_count": 1,
+                    "correct_count": 1 if row["is_correct"] else 0
+                }
+                for test_id, _, answer_rows in results
+                for row in answer_rows
+            ],
+            ["answered_count", "correct_count"]
+        )
+    
+    @staticmethod
+    def record_suspicious(db: Session, test_id: int) -> None:
+        _increment_counters(
+            db, TestStatistics, ["test_id"],
+            [{
+                "test_id": test_id,
+                "result_count": 0,
+                "percentage_sum": 0.0,
+                "percentage_sq_sum": 0.0,
+                "suspicious_count": 1
+            }],
+            ["suspicious_count"]
+        )
+    
+    @staticmethod
+    def get_stats(db: Session, test_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Статистика по тестам из агрегатов - три запроса независимо от числа результатов"""
+        statistics_query = db.query(TestStatistics)
+        buckets_query = db.query(TestScoreBucket)
+        questions_query = db.query(QuestionStatistics)
         if test_id:
-            query = query.filter(TestResult.test_id == test_id)
+            statistics_query = statistics_query.filter(TestStatistics.test_id == test_id)
+            buckets_query = buckets_query.filter(TestScoreBucket.test_id == test_id)
+            questions_query = questions_query.filter(QuestionStatistics.test_id == test_id)
+        
+        histograms: Dict[int, List[int]] = {}
+        for bucket in buckets_query:
+            histogram = histograms.setdefault(bucket.test_id, [0] * StatisticsService.HISTOGRAM_BUCKETS)
+            histogram[bucket.bucket] = bucket.result_count
+        
+        questions: Dict[int, List[Dict[str, Any]]] = {}
+        for question in questions_query.order_by(QuestionStatistics.question_id):
+            questions.setdefault(question.test_id, []).append({
+                "question_id": question.question_id,
+                "answered_count": question.answered_count,
+                "correct_count": question.correct_count,
+                "correct_rate": question.correct_count / question.answered_count if question.answered_count else 0.0
+            })
+        
+        stats = []
+        for statistics in statistics_query.order_by(TestStatistics.test_id):
+            count = statistics.result_count
+            mean = statistics.percentage_sum / count if count else 0.0
+            variance = statistics.percentage_sq_sum / count - mean * mean if count else 0.0
+            stats.append({
+                "test_id": statistics.test_id,
+                "result_count": count,
+                "mean_percentage": mean,
+                "stddev_percentage": math.sqrt(max(variance, 0.0)),
+                "histogram": histograms.get(statistics.test_id, [0] * StatisticsService.HISTOGRAM_BUCKETS),
+                "suspicious_count": statistics.suspicious_count,
+                "questions": questions.get(statistics.test_id, [])
+            })
+        return stats
+    
+    @staticmethod
+    def rebuild(db: Session, batch_size: int = 5000) -> None:
+        """Пересчитывает агрегаты по всем результатам (для существующих баз)"""
+        db.query(TestStatistics).delete()
+        db.query(TestScoreBucket).delete()
+        db.query(QuestionStatistics).delete()
+        
+        statistics: Dict[int, Dict[str, Any]] = {}
+        buckets: Dict[tuple, int] = {}
+        for test_id, percentage, is_suspicious in db.query(
+            TestResult.test_id, TestResult.percentage, TestResult.is_suspicious
+        ).yield_per(batch_size):
+            percentage = percentage or 0.0
+            row = statistics.setdefault(test_id, {
+                "test_id": test_id,
+                "result_count": 0,
+                "percentage_sum": 0.0,
+                "percentage_sq_sum": 0.0,
+                "suspicious_count": 0
+            })
+            row["result_count"] += 1
+            row["percentage_sum"] += percentage
+            row["percentage_sq_sum"] += percentage * percentage
+            row["suspicious_count"] += 1 if is_suspicious else 0
+            key = (test_id, StatisticsService._bucket(percentage))
+            buckets[key] = buckets.get(key, 0) + 1
+        
+        if statistics:
+            db.execute(insert(TestStatistics), list(statistics.values()))
+        if buckets:
+            db.execute(insert(TestScoreBucket), [
+                {"test_id": test_id, "bucket": bucket, "result_count": count}
+                for (test_id, bucket), count in buckets.items()
+            ])
+        
+        db.execute(
+            insert(QuestionStatistics).from_select(
+                ["question_id", "test_id", "answered_count", "correct_count"],
+                select(
+                    Answer.question_id,
+                    Question.test_id,
+                    func.count(Answer.id),
+                    func.sum(case((Answer.is_correct == True, 1), else_=0))
+                ).join(Question, Question.id == Answer.question_id).group_by(
+                    Answer.question_id, Question.test_id
+                )
+            )
+        )
+        db.commit()
+
+
+class ExportService:
+    # Размер пачки при потоковом чтении результатов (yield_per / серверный курсор)
+    STREAM_BATCH_SIZE = 500
+    ANSWER_BATCH_SIZE = 5000
+    
+    # Плоская выгрузка для аналитики: одна строка на ответ
+    ANSWER_EXPORT_COLUMNS = (
+        ("result_id", TestResult.id),
+        ("test_id", TestResult.test_id),
+        ("test_name", Test.name),
+        ("telegram_id", User.telegram_id),
+        ("username", User.username),
+        ("first_name", User.first_name),
+        ("last_name", User.last_name),
+        ("started_at", TestResult.started_at),
+        ("completed_at", TestResult.completed_at),
+        ("total_score", TestResult.total_score),
+        ("max_score", TestResult.max_score),
+        ("percentage", TestResult.percentage),
+        ("is_suspicious", TestResult.is_suspicious),
+        ("answer_id", Answer.id),
+        ("question_id", Answer.question_id),
+        ("question_order", Question.order),
+        ("question_type", Question.question_type),
+        ("question_text", Question.question_text),
+        ("answer_text", Answer.answer_text),
+        ("is_correct", Answer.is_correct),
+        ("points_earned", Answer.points_earned),
+        ("time_spent", Answer.time_spent),
+    )
+    ANSWER_EXPORT_FORMATS = {
+        # формат: (media type, расширение файла)
+        "csv": ("text/csv; charset=utf-8", "csv"),
+        "ndjson_gz": ("application/gzip", "ndjson.gz"),
+    }
+    # Столбцы компактных строк рендеринга (порядок полей кортежей app.rendering)
+    RESULT_ROW_COLUMNS = (
+        TestResult.id, TestResult.test_id, User.telegram_id, User.username, User.first_name, User.last_name,
+        TestResult.total_score, TestResult.max_score, TestResult.percentage,
+        TestResult.started_at, TestResult.completed_at, TestResult.updated_at,
+        TestResult.is_suspicious, TestResult.suspicious_reasons, TestResult.analysis_status,
+    )
+    ANSWER_ROW_COLUMNS = (
+        Answer.question_id, Answer.answer_text, Answer.is_correct, Answer.points_earned, Answer.time_spent,
+    )
+    QUESTION_ROW_COLUMNS = (
+        Question.id, Question.order, Question.question_text, Question.question_type,
+        Question.points, Question.correct_answer,
+    )
+    RESULT_EXPORT_FORMATS = {
+        "json": ("application/json", "json"),
+        "ndjson": ("application/x-ndjson", "ndjson"),
+        "markdown": ("text/markdown", "md"),
+    }
+    
+    @staticmethod
+    def _filtered_results_query(db: Session, test_id: Optional[int] = None,
+                                date_from: Optional[datetime] = None,
+                                date_to: Optional[datetime] = None,
+                                include_suspicious: bool = True):
+        return db.query(TestResult).filter(
+            *ExportService._result_filters(test_id, date_from, date_to, include_suspicious)
+        )
+    
+    @staticmethod
+    def _result_filters(test_id: Optional[int] = None,
+                        date_from: Optional[datetime] = None,
+                        date_to: Optional[datetime] = None,
+                        include_suspicious: bool = True) -> list:
+        filters = []
+        
+        if test_id:
+            filters.append(TestResult.test_id == test_id)
         
         if date_from:
-            query = query.filter(TestResult.created_at >= date_from)
+            filters.append(TestResult.created_at >= date_from)
         
         if date_to:
-            query = query.filter(TestResult.created_at <= date_to)
+            filters.append(TestResult.created_at <= date_to)
         
         if not include_suspicious:
-            query = query.filter(TestResult.is_suspicious == False)
+            filters.append(TestResult.is_suspicious == False)
         
-        results = query.all()
+        return filters
+    
+    @staticmethod
+    def data_fingerprint(db: Session, test_id: Optional[int] = None,
+                         date_from: Optional[datetime] = None,
+                         date_to: Optional[datetime] = None,
+                         include_suspicious: bool = True) -> Tuple[Any, ...]:
+        """Версия выгружаемых данных одним агрегатным запросом: число результатов, максимальный
+        id, последнее изменение результата и его пользователя, число результатов без анализа
+        (updated_at на SQLite - с точностью до секунды), последнее изменение каталога"""
+        row = db.query(
+            func.count(TestResult.id),
+            func.max(TestResult.id),
+            func.max(TestResult.updated_at),
+            func.max(User.updated_at),
+            func.sum(case((TestResult.analysis_status == "pending", 1), else_=0)),
+            select(func.max(Test.updated_at)).scalar_subquery(),
+            select(func.count(Question.id)).scalar_subquery(),
+            select(func.max(Question.updated_at)).scalar_subquery()
+        ).select_from(TestResult).join(User, User.id == TestResult.user_id).filter(
+            *ExportService._result_filters(test_id, date_from, date_to, include_suspicious)
+        ).one()
+        return tuple(value.isoformat() if isinstance(value, datetime) else value for value in row)
+    
+    @staticmethod
+    def cache_key(db: Session, kind: str, format: str, test_id: Optional[int] = None,
+                  date_from: Optional[datetime] = None,
+                  date_to: Optional[datetime] = None,
+                  include_suspicious: bool = True) -> str:
+        """Ключ кэша выгрузки: нормализованные фильтры и отпечаток данных. Отпечаток
+        целиком берется из базы, поэтому ключ верен во всех процессах и после перезапуска"""
+        return export_cache.make_key(
+            kind,
+            format,
+            test_id or None,
+            date_from.isoformat() if date_from else None,
+            date_to.isoformat() if date_to else None,
+            bool(include_suspicious),
+            ExportService.data_fingerprint(db, test_id, date_from, date_to, include_suspicious)
+        )
+    
+    @staticmethod
+    def _with_export_options(query):
+        """Пользователь и тест подгружаются JOIN-ом, ответы - одним IN-запросом на пачку"""
+        return query.options(
+            joinedload(TestResult.user),
+            joinedload(TestResult.test),
+            selectinload(TestResult.answers)
+        )
+    
+    @staticmethod
+    def _test_questions(db: Session, test_id: int,
+                        questions_cache: Dict[int, Tuple[QuestionRow, ...]]) -> Tuple[QuestionRow, ...]:
+        """Упорядоченные вопросы теста, загружаются один раз за экспорт"""
+        questions = questions_cache.get(test_id)
+        if questions is None:
+            questions = tuple(
+                QuestionRow(*row) for row in db.query(*ExportService.QUESTION_ROW_COLUMNS).filter(
+                    Question.test_id == test_id
+                ).order_by(Question.order)
+            )
+            questions_cache[test_id] = questions
+        return questions
+    
+    @staticmethod
+    def _result_row(result: TestResult) -> ResultRow:
+        user = result.user
+        return ResultRow(
+            result.id, result.test_id, user.telegram_id, user.username, user.first_name, user.last_name,
+            result.total_score, result.max_score, result.percentage,
+            result.started_at, result.completed_at, result.updated_at,
+            result.is_suspicious, result.suspicious_reasons, result.analysis_status,
+            tuple(
+                AnswerRow(answer.question_id, answer.answer_text, answer.is_correct,
+                          answer.points_earned, answer.time_spent)
+                for answer in result.answers
+            )
+        )
+    
+    @staticmethod
+    def _test_row(test: Test) -> TestRow:
+        return TestRow(test.id, test.name, test.test_type, test.description)
+    
+    @staticmethod
+    def export_rows(db: Session, test_id: Optional[int] = None,
+                    date_from: Optional[datetime] = None,
+                    date_to: Optional[datetime] = None,
+                    include_suspicious: bool = True,
+                    after_id: Optional[int] = None,
+                    until_id: Optional[int] = None,
+                    limit: Optional[int] = None) -> ExportRows:
+        """Данные выгрузки компактными кортежами (для рендеринга в пуле процессов):
+        четыре запроса по столбцам, без ORM-объектов. after_id, until_id и limit
+        выбирают пачку результатов по порядку id (для потоковой выгрузки)"""
+        filters = ExportService._result_filters(test_id, date_from, date_to, include_suspicious)
+        if after_id is not None:
+            filters.append(TestResult.id > after_id)
+        if until_id is not None:
+            filters.append(TestResult.id <= until_id)
         
-        if format == "json":
-            return ExportService._export_to_json(db, results)
-        elif format == "markdown":
-            return ExportService._export_to_markdown(db, results)
-        else:
-            raise ValueError("Unsupported format")
+        result_rows = db.execute(
+            select(*ExportService.RESULT_ROW_COLUMNS).join(
+                User, User.id == TestResult.user_id
+            ).where(*filters).order_by(TestResult.id).limit(limit)
+        ).all()
+        if limit is not None and result_rows:
+            # Ответы - только результатов пачки
+            filters.append(TestResult.id <= result_rows[-1][0])
+        
+        answers_by_result: Dict[int, List[AnswerRow]] = {}
+        for result_id, *answer in db.execute(
+            select(Answer.test_result_id, *ExportService.ANSWER_ROW_COLUMNS).join(
+                TestResult, TestResult.id == Answer.test_result_id
+            ).where(*filters).order_by(Answer.id)
+        ):
+            answers_by_result.setdefault(result_id, []).append(AnswerRow(*answer))
+        
+        results = [ResultRow(*row, tuple(answers_by_result.get(row[0], ()))) for row in result_rows]
+        
+        test_ids = list({result.test_id for result in results})
+        tests: Dict[int, TestRow] = {}
+        questions: Dict[int, Tuple[QuestionRow, ...]] = {}
+        if test_ids:
+            tests = {
+                row[0]: TestRow(*row)
+                for row in db.execute(
+                    select(Test.id, Test.name, Test.test_type, Test.description).where(Test.id.in_(test_ids))
+                )
+            }
+            grouped: Dict[int, List[QuestionRow]] = {}
+            for question_test_id, *question in db.execute(
+                select(Question.test_id, *ExportService.QUESTION_ROW_COLUMNS).where(
+                    Question.test_id.in_(test_ids)
+                ).order_by(Question.test_id, Question.order)
+            ):
+                grouped.setdefault(question_test_id, []).append(QuestionRow(*question))
+            questions = {key: tuple(value) for key, value in grouped.items()}
+        
+        return ExportRows(tests, questions, results)
     
     @staticmethod
-    def _export_to_json(db: Session, results: List[TestResult]) -> Dict[str, Any]:
-        export_data = {
-            "export_date": datetime.utcnow().isoformat(),
-            "total_results": len(results),
-            "results": []
-        }
+    def export_results(db: Session, format: str, test_id: Optional[int] = None,
+                      date_from: Optional[datetime] = None, 
+                      date_to: Optional[datetime] = None,
+                      include_suspicious: bool = True) -> Dict[str, Any]:
         
-        for result in results:
-            user = db.query(User).filter(User.id == result.user_id).first()
-            test = db.query(Test).filter(Test.id == result.test_id).first()
+        with metrics.time_export(format):
+            query = ExportService._filtered_results_query(
+                db, test_id, date_from, date_to, include_suspicious
+            )
             
-            # Получаем все вопросы теста
-            questions = db.query(Question).filter(
-                Question.test_id == result.test_id
-            ).order_by(Question.order).all()
+            results = ExportService._with_export_options(query).all()
             
-            # Получаем все ответы пользователя
-            answers = db.query(Answer).filter(
-                Answer.test_result_id == result.id
-            ).all()
+            if format == "json":
+                return ExportService._export_to_json(db, results)
+            elif format == "markdown":
+                return ExportService._export_to_markdown(db, results)
+            else:
+                raise ValueError("Unsupported format")
+    
+    @staticmethod
+    def export_changes(db: Session, since: Optional[str] = None, limit: int = 1000,
+                       test_id: Optional[int] = None) -> Dict[str, Any]:
+        """Результаты, измененные после водяного знака since, по порядку (updated_at, id).
+        
+        Отдаются только изменения старше границы _changes_upper_bound: так транзакция,
+        поставившая updated_at раньше, но зафиксированная позже, не окажется за водяным знаком.
+        Стоимость выгрузки пропорциональна числу изменений (индекс по (updated_at, id)).
+        """
+        with metrics.time_export("changes"):
+            upper_bound = ExportService._changes_upper_bound(db)
+            updated_at_key = _comparable_timestamp(db, TestResult.updated_at)
+            query = db.query(TestResult).filter(updated_at_key < _comparable_timestamp(db, upper_bound))
             
-            # Создаем словарь ответов для быстрого поиска
-            answers_dict = {answer.question_id: answer for answer in answers}
+            if test_id:
+                query = query.filter(TestResult.test_id == test_id)
             
-            # Формируем детальную информацию о вопросах и ответах
-            questions_answers = []
-            for question in questions:
-                answer = answers_dict.get(question.id)
-                question_data = {
-                    "question_id": question.id,
-                    "question_text": question.question_text,
-                    "question_type": question.question_type,
-                    "order": question.order,
-                    "points": question.points,
-                    "correct_answer": question.correct_answer,
-                    "candidate_answer": {
-                        "answer_text": answer.answer_text if answer else None,
-                        "is_correct": answer.is_correct if answer else None,
-                        "points_earned": answer.points_earned if answer else 0.0,
-                        "time_spent": answer.time_spent if answer else None
-                    } if answer else None
-                }
-                questions_answers.append(question_data)
+            if since:
+                updated_at, result_id = ExportService._decode_watermark(since)
+                query = query.filter(
+                    tuple_(updated_at_key, TestResult.id) > tuple_(_comparable_timestamp(db, updated_at), result_id)
+                )
             
-            result_data = {
-                "id": result.id,
-                "user": {
-                    "telegram_id": user.telegram_id,
-                    "username": user.username,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "full_name": f"{user.first_name or ''} {user.last_name or ''}".strip() or f"User {user.telegram_id}"
-                },
-                "test": {
-                    "id": test.id,
-                    "name": test.name,
-                    "type": test.test_type,
-                    "description": test.description
-                },
-                "score": {
-                    "total": result.total_score,
-                    "max": result.max_score,
-                    "percentage": result.percentage
-                },
-                "timing": {
-                    "started_at": result.started_at.isoformat(),
-                    "completed_at": result.completed_at.isoformat() if result.completed_at else None,
-                    "total_duration": (result.completed_at - result.started_at).total_seconds() if result.completed_at else None
-                },
-                "suspicious": {
-                    "is_suspicious": result.is_suspicious,
-                    "reasons": result.suspicious_reasons or []
-                },
-                "questions_and_answers": questions_answers
-            }
+            # Берем на одну запись больше, чтобы понять, есть ли еще изменения
+            results = ExportService._with_export_options(query).order_by(
+                updated_at_key, TestResult.id
+            ).limit(limit + 1).all()
             
-            export_data["results"].append(result_data)
+            has_more = len(results) > limit
+            results = results[:limit]
+            questions_cache: Dict[int, Tuple[QuestionRow, ...]] = {}
+            return {
+                "results": [ExportService._result_to_json(db, result, questions_cache) for result in results],
+                "count": len(results),
+                # Без изменений водяной знак не двигается
+                "watermark": ExportService._encode_watermark(results[-1]) if results else since,
+                "has_more": has_more
+            }
+    
+    @staticmethod
+    def _changes_upper_bound(db: Session) -> datetime:
+        """Граница инкрементальной выгрузки: изменения с updated_at не меньше нее еще могут
+        быть не зафиксированы.
         
-        return export_data
+        updated_at = now() - время начала транзакции, поэтому на PostgreSQL граница не
+        позже начала самой старой открытой транзакции в базе (pg_stat_activity; роль
+        приложения должна видеть свои сеансы). Долгие транзакции, в т.ч. только читающие,
+        задерживают выгрузку, но не теряют изменения. На SQLite граница - текущее время UTC
+        минус export_watermark_lag_seconds: изменения транзакций длиннее этой задержки
+        могут быть пропущены.
+        """
+        lag = timedelta(seconds=settings.export_watermark_lag_seconds)
+        if db.get_bind().dialect.name == "postgresql":
+            now, oldest_transaction = db.execute(text(
+                "SELECT now(), (SELECT min(xact_start) FROM pg_stat_activity"
+                " WHERE datname = current_database() AND pid <> pg_backend_pid())"
+            )).one()
+            upper_bound = now - lag
+            if oldest_transaction is not None:
+                upper_bound = min(upper_bound, oldest_transaction)
+            return upper_bound
+        # SQLite хранит время без пояса, CURRENT_TIMESTAMP - в UTC
+        return datetime.utcnow() - lag
     
     @staticmethod
-    def _export_to_markdown(db: Session, results: List[TestResult]) -> Dict[str, Any]:
-        markdown_content = f"""# Quantum Insight - Результаты тестирования
-
-**Дата экспорта:** {datetime.utcnow().strftime('%d.%m.%Y %H:%M:%S')}
-**Всего результатов:** {len(results)}
-
----
-
-"""
+    def _encode_watermark(result: TestResult) -> str:
+        raw = f"{result.updated_at.isoformat()}|{result.id}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+    
+    @staticmethod
+    def _decode_watermark(watermark: str) -> Tuple[datetime, int]:
+        try:
+            raw = base64.urlsafe_b64decode(watermark.encode("ascii")).decode("utf-8")
+            updated_at, result_id = raw.rsplit("|", 1)
+            return datetime.fromisoformat(updated_at), int(result_id)
+        except (ValueError, UnicodeError):
+            raise ValueError("Invalid watermark")
+    
+    @staticmethod
+    def stream_results(db: Session, format: str, test_id: Optional[int] = None,
+                       date_from: Optional[datetime] = None,
+                       date_to: Optional[datetime] = None,
+                       include_suspicious: bool = True,
+                       progress: Optional[Callable[[int], None]] = None) -> Iterator[str]:
+        """Потоковый экспорт: JSON-массив или NDJSON, по одному результату за раз"""
+        if format not in ("json", "ndjson"):
+            raise ValueError("Unsupported format")
         
-        for result in results:
-            user = db.query(User).filter(User.id == result.user_id).first()
-            test = db.query(Test).filter(Test.id == result.test_id).first()
-            
-            # Получаем вопросы и ответы
-            questions = db.query(Question).filter(
-                Question.test_id == result.test_id
-            ).order_by(Question.order).all()
-            
-            answers = db.query(Answer).filter(
-                Answer.test_result_id == result.id
-            ).all()
+        with metrics.time_export(f"{format}_stream"):
+            query = ExportService._with_export_options(
+                ExportService._filtered_results_query(
+                    db, test_id, date_from, date_to, include_suspicious
+                )
+            ).order_by(TestResult.id).yield_per(ExportService.STREAM_BATCH_SIZE)
+            query = _report_progress(query, progress)
+            questions_cache: Dict[int, Tuple[QuestionRow, ...]] = {}
             
-            answers_dict = {answer.question_id: answer for answer in answers}
+            if format == "ndjson":
+                for result in query:
+                    yield json.dumps(
+                        ExportService._result_to_json(db, result, questions_cache), ensure_ascii=False
+                    ) + "\n"
+                return
             
-            markdown_content += f"""## Результат #{result.id}
-
-**Пользователь:** {user.first_name or ''} {user.last_name or ''} (@{user.username or 'None'})
-**Telegram ID:** {user.telegram_id}
-**Тест:** {test.name} ({test.test_type})
-
-**Результаты:**
-- Общий балл: {result.total_score}/{result.max_score}
-- Процент: {result.percentage:.1f}%
-- Время начала: {result.started_at.strftime('%d.%m.%Y %H:%M:%S')}
-- Время завершения: {result.completed_at.strftime('%d.%m.%Y %H:%M:%S') if result.completed_at else 'Не завершен'}
-
-**Подозрительная активность:** {'Да' if result.is_suspicious else 'Нет'}
-"""
-            
-            if result.suspicious_reasons:
-                markdown_content += f"**Причины:** {', '.join(result.suspicious_reasons)}\n"
+            # Количество результатов заранее неизвестно, поэтому total_results идет в конце
+            yield '{"export_date": %s, "results": [' % json.dumps(datetime.utcnow().isoformat())
+            total_results = 0
+            for result in query:
+                if total_results:
+                    yield ","
+                yield json.dumps(
+                    ExportService._result_to_json(db, result, questions_cache), ensure_ascii=False
+                )
+                total_results += 1
+            yield '], "total_results": %d}' % total_results
+    
+    @staticmethod
+    def _export_to_json(db: Session, results: List[TestResult]) -> Dict[str, Any]:
+        export_data = {
+            "export_date": datetime.utcnow().isoformat(),
+            "total_results": len(results),
+            "results": []
+        }
+        
+        questions_cache: Dict[int, Tuple[QuestionRow, ...]] = {}
+        for result in results:
+            export_data["results"].append(ExportService._result_to_json(db, result, questions_cache))
+        
+        return export_data
+    
+    @staticmethod
+    def _result_to_json(db: Session, result: TestResult,
+                        questions_cache: Dict[int, Tuple[QuestionRow, ...]]) -> Dict[str, Any]:
+        # Пользователь, тест и ответы уже загружены вместе с результатом
+        return rendering.result_to_json(
+            ExportService._result_row(result),
+            ExportService._test_row(result.test),
+            ExportService._test_questions(db, result.test_id, questions_cache)
+        )
+    
+    @staticmethod
+    def stream_markdown(db: Session, test_id: Optional[int] = None,
+                        date_from: Optional[datetime] = None,
+                        date_to: Optional[datetime] = None,
+                        include_suspicious: bool = True,
+                        progress: Optional[Callable[[int], None]] = None) -> Iterator[str]:
+        """Потоковый Markdown-отчет: фрагменты отдаются клиенту по мере рендеринга"""
+        with metrics.time_export("markdown_stream"):
+            query = ExportService._filtered_results_query(
+                db, test_id, date_from, date_to, include_suspicious
+            )
+            total_results = query.count()
             
-            markdown_content += "\n**Вопросы и ответы:**\n\n"
+            yield from ExportService._render_markdown(
+                db,
+                _report_progress(
+                    ExportService._with_export_options(query).order_by(TestResult.id).yield_per(
+                        ExportService.STREAM_BATCH_SIZE
+                    ),
+                    progress
+                ),
+                total_results
+            )
+    
+    @staticmethod
+    def stream_answers(db: Session, format: str, test_id: Optional[int] = None,
+                       date_from: Optional[datetime] = None,
+                       date_to: Optional[datetime] = None,
+                       include_suspicious: bool = True,
+                       progress: Optional[Callable[[int], None]] = None) -> Iterator[bytes]:
+        """Плоская выгрузка ответов (CSV или NDJSON в gzip) за один проход:
+        ответы читаются крупными пакетами по порядку id вместе с результатом,
+        пользователем, тестом и вопросом"""
+        if format not in ExportService.ANSWER_EXPORT_FORMATS:
+            raise ValueError("Unsupported format")
+        
+        with metrics.time_export(f"{format}_stream"):
+            names = [name for name, _ in ExportService.ANSWER_EXPORT_COLUMNS]
+            stmt = select(*[column for _, column in ExportService.ANSWER_EXPORT_COLUMNS]).select_from(Answer).join(
+                TestResult, TestResult.id == Answer.test_result_id
+            ).join(User, User.id == TestResult.user_id).join(Test, Test.id == TestResult.test_id).join(
+                Question, Question.id == Answer.question_id
+            ).where(
+                *ExportService._result_filters(test_id, date_from, date_to, include_suspicious)
+            ).order_by(Answer.id).execution_options(yield_per=ExportService.ANSWER_BATCH_SIZE)
+            batches = _report_progress(db.execute(stmt).partitions(), progress, len)
             
-            for question in questions:
-                answer = answers_dict.get(question.id)
-                markdown_content += f"**{question.order}. {question.question_text}**\n"
-                markdown_content += f"- **Правильный ответ:** {question.correct_answer}\n"
-                if answer:
-                    markdown_content += f"- **Ответ кандидата:** {answer.answer_text}\n"
-                    markdown_content += f"- **Правильно:** {'Да' if answer.is_correct else 'Нет'}\n"
-                    markdown_content += f"- **Баллы:** {answer.points_earned}/{question.points}\n"
-                    if answer.time_spent:
-                        markdown_content += f"- **Время ответа:** {answer.time_spent} сек\n"
-                else:
-                    markdown_content += "- **Ответ кандидата:** Не отвечен\n"
-                markdown_content += "\n"
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(names)
+                for batch in batches:
+                    writer.writerows(batch)
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue().encode("utf-8")
+                return
             
-            markdown_content += "---\n\n"
-        
+            # gzip-поток: сжатие идет пакетами, в памяти только текущий пакет
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            for batch in batches:
+                chunk = "".join(
+                    json.dumps(dict(zip(names, row)), ensure_ascii=False, default=_json_default) + "\n"
+                    for row in batch
+                )
+                compressed = compressor.compress(chunk.encode("utf-8"))
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+    
+    @staticmethod
+    def count_export_rows(db: Session, format: str, test_id: Optional[int] = None,
+                          date_from: Optional[datetime] = None,
+                          date_to: Optional[datetime] = None,
+                          include_suspicious: bool = True) -> int:
+        """Число строк выгрузки для прогресса: ответов для плоских форматов, иначе результатов"""
+        filters = ExportService._result_filters(test_id, date_from, date_to, include_suspicious)
+        if format in ExportService.ANSWER_EXPORT_FORMATS:
+            return db.query(func.count(Answer.id)).join(
+                TestResult, TestResult.id == Answer.test_result_id
+            ).filter(*filters).scalar()
+        return db.query(func.count(TestResult.id)).filter(*filters).scalar()
+    
+    @staticmethod
+    def export_results_range(db: Session, test_id: Optional[int] = None,
+                             date_from: Optional[datetime] = None,
+                             date_to: Optional[datetime] = None,
+                             include_suspicious: bool = True) -> Tuple[int, Optional[int]]:
+        """Число результатов выгрузки и id последнего из них: потоковая выгрузка пачками
+        не выходит за этот id, и итог в заголовке совпадает с содержимым"""
+        filters = ExportService._result_filters(test_id, date_from, date_to, include_suspicious)
+        return tuple(db.query(func.count(TestResult.id), func.max(TestResult.id)).filter(*filters).one())
+    
+    @staticmethod
+    def render_export(db: Session, format: str, progress: Optional[Callable[[int], None]] = None,
+                      **filters) -> Iterator[bytes]:
+        """Потоковый рендеринг выгрузки любого формата в байты (для файлов экспорта)"""
+        if format in ExportService.ANSWER_EXPORT_FORMATS:
+            yield from ExportService.stream_answers(db, format, progress=progress, **filters)
+        elif format == "markdown":
+            for fragment in ExportService.stream_markdown(db, progress=progress, **filters):
+                yield fragment.encode("utf-8")
+        elif format in ("json", "ndjson"):
+            for fragment in ExportService.stream_results(db, format, progress=progress, **filters):
+                yield fragment.encode("utf-8")
+        else:
+            raise ValueError("Unsupported format")
+    
+    @staticmethod
+    def export_format_info(format: str) -> Tuple[str, str]:
+        """(media type, расширение файла) формата выгрузки"""
+        if format in ExportService.ANSWER_EXPORT_FORMATS:
+            return ExportService.ANSWER_EXPORT_FORMATS[format]
+        return ExportService.RESULT_EXPORT_FORMATS[format]
+    
+    @staticmethod
+    def export_file_extension(format: str) -> str:
+        return ExportService.export_format_info(format)[1]
+    
+    @staticmethod
+    def export_filename(kind: str, format: str) -> str:
+        """Имя файла выгрузки: kind - results (по результатам) или answers (по ответам)"""
+        extension = ExportService.export_file_extension(format)
+        return f"quantum_insight_{kind}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    
+    @staticmethod
+    def markdown_filename() -> str:
+        return f"quantum_insight_results_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.md"
+    
+    @staticmethod
+    def _export_to_markdown(db: Session, results: List[TestResult]) -> Dict[str, Any]:
         return {
-            "content": markdown_content,
-            "filename": f"quantum_insight_results_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.md"
-        } 
\ No newline at end of file
+            "content": "".join(ExportService._render_markdown(db, results, len(results))),
+            "filename": ExportService.markdown_filename()
+        }
+    
+    @staticmethod
+    def _render_markdown(db: Session, results: Iterable[TestResult], total_results: int) -> Iterator[str]:
+        yield rendering.markdown_header(datetime.utcnow(), total_results)
+        
+        questions_cache: Dict[int, Tuple[QuestionRow, ...]] = {}
+        for result in results:
+            yield from rendering.result_to_markdown(
+                ExportService._result_row(result),
+                ExportService._test_row(result.test),
+                ExportService._test_questions(db, result.test_id, questions_cache)
+            )
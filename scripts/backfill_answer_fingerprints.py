@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Скрипт для заполнения хэшей ответов и пересчета таблицы отпечатков ответов
+"""
+
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from alembic import command
+from alembic.config import Config
+
+from app.database import SessionLocal
+from app.services import TestResultService
+
+
+def backfill_answer_fingerprints():
+    """Заполнение answer_hash и answer_fingerprints по существующим ответам"""
+    # Приводим схему к актуальной: create_all не добавляет столбцы
+    # (answers.answer_hash) в уже существующие таблицы
+    command.upgrade(Config(os.path.join(ROOT_DIR, "alembic.ini")), "head")
+    
+    db = SessionLocal()
+    try:
+        updated = TestResultService.rebuild_answer_fingerprints(db)
+        print(f"Обновлено ответов: {updated}")
+        print("Таблица отпечатков ответов пересчитана")
+    except Exception as e:
+        print(f"Ошибка при пересчете отпечатков: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    backfill_answer_fingerprints()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк API: смесь запросов каталога, вопросов, отправки ответов и экспорта.
+
+По умолчанию приложение запускается в процессе через httpx.ASGITransport
+(с lifespan и подсчетом SQL-запросов на эндпоинт); с --base-url запросы идут
+на уже запущенный сервер (например, uvicorn app.main:app).
+
+Примеры:
+    python scripts/benchmark.py --fresh-db --requests 2000 --concurrency 20 --save-baseline bench.json
+    python scripts/benchmark.py --fresh-db --requests 2000 --concurrency 20 --baseline bench.json
+
+Базовый и проверяемый прогоны сравнимы только на одинаковых данных: --fresh-db
+создает временную SQLite-базу с тестовыми данными scripts/init_db.py.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import random
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+
+DEFAULT_MIX = "tests=25,questions=25,submit=40,export=5,export_stream=5"
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight)
+    unknown = set(weights) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Catalog:
+    """Тесты и вопросы, из которых строятся запросы"""
+
+    def __init__(self, tests: List[dict], questions: Dict[int, List[dict]]):
+        self.tests = tests
+        self.questions = questions
+
+    @classmethod
+    async def load(cls, client: httpx.AsyncClient) -> "Catalog":
+        response = await client.get("/api/tests/")
+        response.raise_for_status()
+        tests = response.json()
+        if not tests:
+            raise RuntimeError("В базе нет активных тестов - запустите scripts/init_db.py")
+        questions = {}
+        for test in tests:
+            response = await client.get(f"/api/tests/{test['id']}/questions")
+            response.raise_for_status()
+            questions[test["id"]] = response.json()
+        return cls(tests, questions)
+
+
+async def scenario_tests(client, catalog, rng):
+    return await client.get("/api/tests/")
+
+
+async def scenario_questions(client, catalog, rng):
+    test = rng.choice(catalog.tests)
+    return await client.get(f"/api/tests/{test['id']}/questions")
+
+
+async def scenario_submit(client, catalog, rng):
+    test = rng.choice(catalog.tests)
+    answers = []
+    for question in catalog.questions[test["id"]]:
+        options = question.get("options") or ["не знаю"]
+        answers.append({
+            "question_id": question["id"],
+            "answer_text": rng.choice(options),
+            "time_spent": rng.randint(5, 90)
+        })
+    return await client.post(
+        f"/api/submissions/{test['id']}/submit",
+        json={
+            "test_id": test["id"],
+            "answers": answers,
+            "total_time": sum(answer["time_spent"] for answer in answers)
+        },
+        headers={"x-telegram-user-id": str(rng.randint(1, 500))}
+    )
+
+
+async def scenario_export(client, catalog, rng):
+    test = rng.choice(catalog.tests)
+    return await client.post("/api/results/export", json={"format": "json", "test_id": test["id"]})
+
+
+async def scenario_export_stream(client, catalog, rng):
+    test = rng.choice(catalog.tests)
+    return await client.get("/api/results/export/stream/ndjson", params={"test_id": test["id"]})
+
+
+SCENARIOS = {
+    "tests": scenario_tests,
+    "questions": scenario_questions,
+    "submit": scenario_submit,
+    "export": scenario_export,
+    "export_stream": scenario_export_stream
+}
+
+
+def prepare_fresh_database() -> str:
+    """Временная SQLite-база с тестовыми данными; вызывается до импорта приложения"""
+    path = os.path.join(tempfile.mkdtemp(prefix="qi_benchmark_"), "benchmark.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    from scripts.init_db import init_database
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_database()
+    return path
+
+
+@asynccontextmanager
+async def make_client(base_url: Optional[str]):
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            yield client, False
+        return
+
+    # Импорт приложения подключает к движкам учет запросов профилировщика
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            yield client, True
+
+
+async def run_benchmark(args) -> dict:
+    # Импорт app - после выбора базы в main()
+    from app.profiler import QueryCounter, track_queries
+
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    plan = rng.choices(list(weights), weights=list(weights.values()), k=args.requests)
+
+    latencies: Dict[str, List[float]] = {name: [] for name in weights}
+    queries: Dict[str, int] = {name: 0 for name in weights}
+    errors: Dict[str, int] = {name: 0 for name in weights}
+
+    async with make_client(args.base_url) as (client, count_queries):
+        catalog = await Catalog.load(client)
+        next_index = iter(range(len(plan)))
+
+        async def worker(worker_id: int):
+            worker_rng = random.Random(args.seed * 1000 + worker_id)
+            for index in next_index:
+                name = plan[index]
+                started = time.perf_counter()
+                try:
+                    with track_queries(QueryCounter()) as counter:
+                        response = await SCENARIOS[name](client, catalog, worker_rng)
+                        # Тело ответа читается целиком, включая потоковый экспорт
+                        await response.aread()
+                    if response.status_code >= 400:
+                        errors[name] += 1
+                except httpx.HTTPError:
+                    errors[name] += 1
+                finally:
+                    latencies[name].append(time.perf_counter() - started)
+                queries[name] += counter.count
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        endpoints[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "queries_per_request": round(queries[name] / len(values), 2) if count_queries else None
+        }
+
+    return {
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "seed": args.seed,
+            "target": args.base_url or "in-process"
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"Цель: {report['settings']['target']}, запросов: {report['settings']['requests']}, "
+          f"параллельность: {report['settings']['concurrency']}")
+    print(f"Время: {report['elapsed_seconds']} с, пропускная способность: {report['throughput_rps']} req/s")
+    print()
+    print(f"{'эндпоинт':<15}{'запросов':>10}{'ошибок':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'SQL/запр':>10}")
+    for name, stats in report["endpoints"].items():
+        queries = stats["queries_per_request"]
+        print(f"{name:<15}{stats['count']:>10}{stats['errors']:>8}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{'-' if queries is None else queries:>10}")
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Регрессии относительно базового прогона: рост p95 и числа SQL-запросов,
+    падение пропускной способности, новые ошибки.
+    Рост p95 меньше min_delta_ms считается шумом."""
+    regressions = []
+
+    base_rps = baseline.get("throughput_rps") or 0
+    if base_rps and report["throughput_rps"] < base_rps * (1 - tolerance):
+        regressions.append(f"throughput: {report['throughput_rps']} req/s < {base_rps} req/s")
+
+    for name, base in baseline.get("endpoints", {}).items():
+        current = report["endpoints"].get(name)
+        if current is None:
+            continue
+        p95_limit = max(base["p95_ms"] * (1 + tolerance), base["p95_ms"] + min_delta_ms)
+        if current["p95_ms"] > p95_limit:
+            regressions.append(f"{name}: p95 {current['p95_ms']} мс > {base['p95_ms']} мс")
+        base_queries = base.get("queries_per_request")
+        current_queries = current.get("queries_per_request")
+        if base_queries is not None and current_queries is not None:
+            if current_queries > base_queries + max(1.0, base_queries * tolerance):
+                regressions.append(f"{name}: SQL-запросов {current_queries} > {base_queries}")
+        if current["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: ошибок {current['errors']} > {base.get('errors', 0)}")
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк API")
+    parser.add_argument("--base-url", help="URL запущенного сервера (по умолчанию - приложение в процессе)")
+    parser.add_argument("--requests", type=int, default=1000, help="Общее число запросов")
+    parser.add_argument("--concurrency", type=int, default=10, help="Число параллельных клиентов")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Веса сценариев (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-baseline", metavar="PATH", help="Сохранить отчет как базовый")
+    parser.add_argument("--baseline", metavar="PATH", help="Сравнить с базовым отчетом")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение (доля, по умолчанию 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Порог шума для p95 в мс (по умолчанию 5)")
+    parser.add_argument("--fresh-db", action="store_true", help="Прогон на временной SQLite-базе с тестовыми данными")
+    parser.add_argument("--json", action="store_true", help="Вывести отчет в JSON")
+    args = parser.parse_args()
+
+    if args.fresh_db:
+        if args.base_url:
+            parser.error("--fresh-db работает только при запуске приложения в процессе")
+        prepare_fresh_database()
+
+    report = asyncio.run(run_benchmark(args))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовый отчет сохранен в {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\nРегрессии относительно базового отчета:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\nРегрессий относительно базового отчета нет")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
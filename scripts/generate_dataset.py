@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетических данных для нагрузочного тестирования и проверки индексов.
+
+Создает N тестов с вопросами, M пользователей и заданное число результатов
+с ответами: уровень кандидатов, сложность вопросов, время ответов и доля
+одинаковых (списанных) ответов распределены правдоподобно.
+
+Результаты и ответы пишутся пакетами: COPY в PostgreSQL, executemany
+в одной транзакции на пакет в остальных базах. Идентификаторы пользователей
+и результатов назначаются на клиенте, поэтому запускать генератор нужно
+на базе без параллельной записи.
+
+Пример (около 5M ответов):
+    python scripts/generate_dataset.py --tests 20 --users 50000 --results 500000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import csv
+import io
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, text
+
+from app.database import SessionLocal, engine
+from app.models import Base, User, Test, Question, TestResult, Answer
+from app.services import TestResultService, StatisticsService
+
+
+TEST_TYPES = ["frontend", "backend"]
+WORDS = [
+    "компонент", "состояние", "запрос", "индекс", "кэш", "поток", "транзакция", "функция",
+    "объект", "массив", "сервер", "клиент", "ошибка", "событие", "модуль", "класс",
+    "память", "очередь", "таблица", "ключ", "значение", "метод", "шаблон", "тип"
+]
+
+RESULT_COLUMNS = [
+    "id", "user_id", "test_id", "started_at", "completed_at", "total_score", "max_score",
+    "percentage", "is_suspicious", "analysis_status", "created_at", "updated_at"
+]
+ANSWER_COLUMNS = [
+    "test_result_id", "question_id", "answer_text", "answer_hash", "is_correct",
+    "points_earned", "time_spent", "created_at"
+]
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("генерация данных")
+    group.add_argument("--tests", type=int, default=10, help="Число тестов")
+    group.add_argument("--questions-per-test", type=int, default=10, help="Вопросов в тесте")
+    group.add_argument("--users", type=int, default=5000, help="Число пользователей")
+    group.add_argument("--results", type=int, default=50000, help="Число результатов (ответов = результатов x вопросов)")
+    group.add_argument("--duplicate-rate", type=float, default=0.05,
+                       help="Доля неверных текстовых ответов, списанных у других кандидатов")
+    group.add_argument("--days", type=int, default=180, help="За сколько дней распределить результаты")
+    group.add_argument("--batch-size", type=int, default=2000, help="Результатов в одном пакете вставки")
+    group.add_argument("--seed", type=int, default=42)
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _create_tests(db, rng: random.Random, tests: int, questions_per_test: int) -> List[Dict]:
+    """Тесты и вопросы (их немного - обычные ORM-вставки)"""
+    created = []
+    for test_number in range(tests):
+        test = Test(
+            name=f"Synthetic Test {test_number + 1}",
+            description="Сгенерированный тест для нагрузочного тестирования",
+            test_type=TEST_TYPES[test_number % len(TEST_TYPES)],
+            time_limit_per_question=rng.choice([60, 90, 120])
+        )
+        questions = []
+        for order in range(1, questions_per_test + 1):
+            if rng.random() < 0.4:
+                options = [_phrase(rng, 3) for _ in range(4)]
+                question = Question(
+                    question_type="multiple_choice",
+                    question_text=f"Вопрос {order}: выберите верный вариант ({_phrase(rng, 4)})",
+                    options=options,
+                    correct_answer=rng.choice(options),
+                    points=rng.choice([1, 1, 2]),
+                    order=order
+                )
+            else:
+                question = Question(
+                    question_type="text",
+                    question_text=f"Вопрос {order}: объясните {_phrase(rng, 4)}",
+                    correct_answer=_phrase(rng, 6),
+                    points=rng.choice([1, 1, 2]),
+                    order=order
+                )
+            test.questions.append(question)
+            questions.append(question)
+        db.add(test)
+        created.append({"test": test, "questions": questions})
+    db.commit()
+
+    return [
+        {
+            "id": entry["test"].id,
+            "time_limit": entry["test"].time_limit_per_question,
+            "questions": [
+                {
+                    "id": question.id,
+                    "type": question.question_type,
+                    "options": question.options,
+                    "correct_answer": question.correct_answer,
+                    "points": float(question.points),
+                    # Сложность вопроса: сдвиг логита вероятности верного ответа
+                    "difficulty": rng.uniform(-1.5, 1.5),
+                    # Общие неверные ответы, которые кандидаты списывают друг у друга
+                    "shared_answers": [_phrase(rng, 5) for _ in range(3)]
+                }
+                for question in entry["questions"]
+            ]
+        }
+        for entry in created
+    ]
+
+
+def _next_id(db, model) -> int:
+    return (db.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _create_users(db, rng: random.Random, users: int, batch_size: int) -> List[Dict]:
+    first_id = _next_id(db, User)
+    first_telegram_id = (db.query(func.max(User.telegram_id)).scalar() or 0) + 1
+    profiles = []
+    for offset in range(users):
+        profiles.append({
+            "id": first_id + offset,
+            # Уровень кандидата и доля тех, кто отвечает подозрительно быстро
+            "ability": rng.betavariate(4, 3),
+            "fast": rng.random() < 0.02
+        })
+
+    rows = [
+        {
+            "id": first_id + offset,
+            "telegram_id": first_telegram_id + offset,
+            "username": f"synthetic_{first_telegram_id + offset}",
+            "first_name": rng.choice(["Алексей", "Мария", "Иван", "Анна", "Дмитрий", "Ольга"]),
+            "last_name": None
+        }
+        for offset in range(users)
+    ]
+    for start in range(0, len(rows), batch_size * 10):
+        db.connection().execute(User.__table__.insert(), rows[start:start + batch_size * 10])
+    db.commit()
+    return profiles
+
+
+def _generate_batch(rng: random.Random, tests: List[Dict], users: List[Dict], first_result_id: int,
+                    count: int, duplicate_rate: float, now: datetime, days: int):
+    results = []
+    answers = []
+    for result_id in range(first_result_id, first_result_id + count):
+        test = rng.choice(tests)
+        user = rng.choice(users)
+        created_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+
+        total_score = 0.0
+        max_score = 0.0
+        total_time = 0
+        for question in test["questions"]:
+            max_score += question["points"]
+            if user["fast"]:
+                time_spent = rng.randint(1, 5)
+            else:
+                time_spent = min(test["time_limit"], max(1, int(rng.lognormvariate(math.log(test["time_limit"] * 0.35), 0.5))))
+            total_time += time_spent
+
+            is_correct = rng.random() < _sigmoid(4 * (user["ability"] - 0.5) - question["difficulty"])
+            if is_correct:
+                answer_text = question["correct_answer"]
+            elif question["type"] == "multiple_choice":
+                answer_text = rng.choice([option for option in question["options"] if option != question["correct_answer"]])
+            elif rng.random() < duplicate_rate:
+                answer_text = rng.choice(question["shared_answers"])
+            else:
+                answer_text = _phrase(rng, rng.randint(3, 10))
+
+            points_earned = question["points"] if is_correct else 0.0
+            total_score += points_earned
+            answers.append((
+                result_id, question["id"], answer_text, TestResultService._answer_hash(answer_text),
+                is_correct, points_earned, time_spent, created_at
+            ))
+
+        results.append((
+            result_id, user["id"], test["id"], created_at - timedelta(seconds=total_time), created_at,
+            total_score, max_score, total_score / max_score * 100 if max_score > 0 else 0,
+            False, "done", created_at, created_at
+        ))
+    return results, answers
+
+
+def _copy_rows(connection, table: str, columns: List[str], rows: List[tuple]) -> None:
+    """COPY ... FROM STDIN через драйвер psycopg2"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+    buffer.seek(0)
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _insert_batch(db, use_copy: bool, results: List[tuple], answers: List[tuple]) -> None:
+    if use_copy:
+        connection = db.connection()
+        _copy_rows(connection, TestResult.__tablename__, RESULT_COLUMNS, results)
+        _copy_rows(connection, Answer.__tablename__, ANSWER_COLUMNS, answers)
+    else:
+        # Core-вставка таблицы без ORM-обвязки - один executemany на пакет
+        connection = db.connection()
+        connection.execute(TestResult.__table__.insert(), [dict(zip(RESULT_COLUMNS, row)) for row in results])
+        connection.execute(Answer.__table__.insert(), [dict(zip(ANSWER_COLUMNS, row)) for row in answers])
+    db.commit()
+
+
+def generate_dataset(tests: int = 10, questions_per_test: int = 10, users: int = 5000, results: int = 50000,
+                     duplicate_rate: float = 0.05, days: int = 180, batch_size: int = 2000,
+                     seed: int = 42) -> Dict[str, int]:
+    """Генерирует данные и пересчитывает производные таблицы (отпечатки ответов, статистику)"""
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    dialect_name = engine.dialect.name
+    use_copy = dialect_name == "postgresql" and engine.dialect.driver == "psycopg2"
+
+    db = SessionLocal()
+    try:
+        if dialect_name == "sqlite":
+            # Данные генерируются заново при сбое, поэтому надежность записи не нужна
+            db.execute(text("PRAGMA synchronous = OFF"))
+
+        started = time.monotonic()
+        test_specs = _create_tests(db, rng, tests, questions_per_test)
+        user_profiles = _create_users(db, rng, users, batch_size)
+        print(f"Создано тестов: {len(test_specs)}, пользователей: {len(user_profiles)}")
+
+        next_result_id = _next_id(db, TestResult)
+        now = datetime.utcnow()
+        answers_total = 0
+        for start in range(0, results, batch_size):
+            count = min(batch_size, results - start)
+            result_rows, answer_rows = _generate_batch(
+                rng, test_specs, user_profiles, next_result_id + start, count, duplicate_rate, now, days
+            )
+            _insert_batch(db, use_copy, result_rows, answer_rows)
+            answers_total += len(answer_rows)
+            print(f"  результатов: {start + count}/{results}, ответов: {answers_total}", end="\r")
+        print()
+
+        if dialect_name == "postgresql":
+            # Идентификаторы назначались на клиенте - сдвигаем последовательности
+            for table in (User.__tablename__, TestResult.__tablename__):
+                db.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+                ))
+            db.commit()
+        print(f"Данные записаны за {time.monotonic() - started:.1f} с, пересчет производных таблиц...")
+
+        TestResultService.rebuild_answer_fingerprints(db)
+        StatisticsService.rebuild(db)
+        print(f"Готово за {time.monotonic() - started:.1f} с")
+
+        return {
+            "tests": len(test_specs),
+            "users": len(user_profiles),
+            "results": results,
+            "answers": answers_total
+        }
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def generate_from_args(args: argparse.Namespace) -> Dict[str, int]:
+    return generate_dataset(
+        tests=args.tests,
+        questions_per_test=args.questions_per_test,
+        users=args.users,
+        results=args.results,
+        duplicate_rate=args.duplicate_rate,
+        days=args.days,
+        batch_size=args.batch_size,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетических данных")
+    add_dataset_arguments(parser)
+    generate_from_args(parser.parse_args())
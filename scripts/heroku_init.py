@@ -3,6 +3,7 @@
 Скрипт для инициализации базы данных на Heroku
 """
 
+import argparse
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -11,6 +12,7 @@ from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine
 from app.models import Base, Test, Question
 from app.config import settings
+from scripts.generate_dataset import add_dataset_arguments, generate_from_args
 
 
 def init_heroku_database():
@@ -208,4 +210,12 @@ def init_heroku_database():
 
 
 if __name__ == "__main__":
-    init_heroku_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Инициализация базы данных")
+    parser.add_argument("--generate", action="store_true",
+                        help="Дополнительно сгенерировать синтетические данные (см. scripts/generate_dataset.py)")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+    
+    init_heroku_database()
+    if args.generate:
+        generate_from_args(args)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Скрипт для перестроения индекса почти одинаковых ответов (MinHash/LSH)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, engine
+from app.models import Base
+from app.services import NearDuplicateService
+
+
+def rebuild_lsh_index():
+    """Пересчет answer_signatures, answer_lsh_buckets и lsh_index_state"""
+    # Создаем недостающие таблицы
+    Base.metadata.create_all(bind=engine)
+    
+    db = SessionLocal()
+    try:
+        indexed = NearDuplicateService.rebuild(db)
+        print(f"В индекс внесено ответов: {indexed}")
+    except Exception as e:
+        print(f"Ошибка при перестроении индекса: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_lsh_index()
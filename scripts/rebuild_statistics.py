@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Скрипт для пересчета агрегированной статистики по тестам
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, engine
+from app.models import Base
+from app.services import StatisticsService
+
+
+def rebuild_statistics():
+    """Пересчет test_statistics, test_score_buckets и question_statistics"""
+    # Создаем недостающие таблицы
+    Base.metadata.create_all(bind=engine)
+    
+    db = SessionLocal()
+    try:
+        StatisticsService.rebuild(db)
+        print("Статистика по тестам пересчитана")
+    except Exception as e:
+        print(f"Ошибка при пересчете статистики: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_statistics()
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+
+# База и настройки задаются до импорта app: engine создается при импорте app.database
+_db_dir = tempfile.mkdtemp(prefix="quantum-insight-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["ANALYSIS_WORKERS"] = "0"
+os.environ["EXPORT_WORKERS"] = "0"
+os.environ["EXPORT_RENDER_WORKERS"] = "0"
+os.environ["EXPORT_DIR"] = os.path.join(_db_dir, "exports")
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import models
+from app.cache import catalog_cache, export_cache, identity_cache
+from app.database import Base, SessionLocal, engine
+from app.grading import grading_cache
+
+
+def _reset_caches():
+    catalog_cache.invalidate()
+    grading_cache.clear()
+    identity_cache.clear()
+    export_cache.clear()
+
+
+@pytest.fixture
+def db():
+    """Сессия на чистой SQLite-базе"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    _reset_caches()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        _reset_caches()
+
+
+@pytest.fixture
+def quiz(db):
+    """Активный тест из трех вопросов: два текстовых и один с вариантами"""
+    test = models.Test(name="Backend Development Test", test_type="backend")
+    db.add(test)
+    db.flush()
+    db.add_all([
+        models.Question(test_id=test.id, question_text="Что такое REST?", question_type="text",
+                        correct_answer="Архитектурный стиль взаимодействия по HTTP", order=1),
+        models.Question(test_id=test.id, question_text="Что такое индекс?", question_type="text",
+                        correct_answer="Структура данных для быстрого поиска строк", order=2),
+        models.Question(test_id=test.id, question_text="Какой метод идемпотентен?", question_type="multiple_choice",
+                        options=["POST", "PUT", "PATCH"], correct_answer="PUT", order=3),
+    ])
+    db.commit()
+    return test
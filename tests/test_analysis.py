@@ -0,0 +1,21 @@
+from datetime import datetime, timedelta, timezone
+
+from app import models
+from app.analysis import AnalysisQueue
+
+
+def test_recovery_reclaims_only_expired_leases(db):
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        models.AnalysisJob(test_result_id=1, status="running", updated_at=now - timedelta(hours=1)),
+        models.AnalysisJob(test_result_id=2, status="running", updated_at=now),
+        models.AnalysisJob(test_result_id=3, status="pending"),
+    ])
+    db.commit()
+
+    queue = AnalysisQueue(workers=0, max_attempts=3, lease_seconds=300)
+    assert queue._recover_pending_jobs() == [1, 3]
+
+    db.expire_all()
+    statuses = dict(db.query(models.AnalysisJob.test_result_id, models.AnalysisJob.status))
+    assert statuses == {1: "pending", 2: "running", 3: "pending"}
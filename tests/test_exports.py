@@ -0,0 +1,181 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import models, schemas, services
+from app.exports import ExportJobQueue, export_render_pool
+from app.main import app
+from app.profiler import profile_queries
+
+
+def _submit_results(db, quiz, count: int) -> None:
+    questions = db.query(models.Question).filter(models.Question.test_id == quiz.id).all()
+    submission = schemas.TestSubmission(
+        test_id=quiz.id,
+        answers=[{"question_id": question.id, "answer_text": "не знаю", "time_spent": 5} for question in questions]
+    )
+    for _ in range(count):
+        user_id = services.UserService.get_or_create_user_id(db, telegram_id=2000 + db.query(models.User).count())
+        services.TestResultService.submit_test(db, submission, user_id)
+
+
+def _export_query_count(db, label: str, export) -> int:
+    db.expire_all()
+    with profile_queries(label) as profile:
+        export()
+    # Ни одна форма запроса не повторяется на каждый результат
+    profile.assert_budget(max_repeats=2)
+    return profile.count
+
+
+EXPORTS = {
+    "json": lambda db: services.ExportService.export_results(db, "json"),
+    "markdown": lambda db: services.ExportService.export_results(db, "markdown"),
+    "json_stream": lambda db: list(services.ExportService.stream_results(db, "json")),
+    "markdown_stream": lambda db: list(services.ExportService.stream_markdown(db)),
+    "rows": lambda db: services.ExportService.export_rows(db),
+}
+
+
+@pytest.mark.parametrize("name", sorted(EXPORTS))
+def test_export_query_count_does_not_grow_with_results(db, quiz, name):
+    export = EXPORTS[name]
+
+    _submit_results(db, quiz, 5)
+    small = _export_query_count(db, f"{name} x5", lambda: export(db))
+
+    _submit_results(db, quiz, 15)
+    large = _export_query_count(db, f"{name} x20", lambda: export(db))
+
+    assert large == small
+
+
+def test_export_changes_pages_by_watermark_and_skips_recent_changes(db, quiz):
+    _submit_results(db, quiz, 3)
+    db.query(models.TestResult).update(
+        {"updated_at": datetime.now(timezone.utc) - timedelta(hours=1)}, synchronize_session=False
+    )
+    db.commit()
+    # Изменение моложе задержки водяного знака еще не отдается
+    _submit_results(db, quiz, 1)
+
+    first = services.ExportService.export_changes(db, limit=2)
+    assert first["count"] == 2 and first["has_more"]
+
+    second = services.ExportService.export_changes(db, since=first["watermark"], limit=2)
+    assert second["count"] == 1 and not second["has_more"]
+    assert [result["id"] for result in first["results"] + second["results"]] == [1, 2, 3]
+
+    third = services.ExportService.export_changes(db, since=second["watermark"])
+    assert third["count"] == 0 and third["watermark"] == second["watermark"]
+
+
+def test_cache_key_follows_user_and_catalog_changes(db, quiz):
+    _submit_results(db, quiz, 2)
+
+    def key():
+        return services.ExportService.cache_key(db, "export", "json")
+
+    initial = key()
+    assert key() == initial
+
+    # Повторная отправка без новых данных пользователя не меняет ключ
+    user = db.query(models.User).first()
+    services.UserService.get_or_create_user_id(db, telegram_id=user.telegram_id, username=None)
+    assert key() == initial
+
+    services.UserService.get_or_create_user_id(db, telegram_id=user.telegram_id, username="renamed")
+    renamed = key()
+    assert renamed != initial
+
+    question = db.query(models.Question).first()
+    question.question_text = "Новая формулировка"
+    # updated_at на SQLite - с точностью до секунды
+    question.updated_at = datetime.now(timezone.utc) + timedelta(minutes=1)
+    db.commit()
+    assert key() != renamed
+
+
+def test_export_recovery_reclaims_only_expired_leases(db, tmp_path):
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        models.ExportJob(format="json", status="running", rows_written=10, updated_at=now - timedelta(hours=2)),
+        models.ExportJob(format="json", status="running", rows_written=10, updated_at=now),
+        models.ExportJob(format="json", status="pending"),
+    ])
+    db.commit()
+
+    queue = ExportJobQueue(workers=0, max_attempts=2, export_dir=str(tmp_path), ttl_hours=24,
+                           cleanup_interval_seconds=600, lease_seconds=3600)
+    assert queue._recover_pending_jobs() == [1, 3]
+
+    db.expire_all()
+    jobs = {job.id: (job.status, job.rows_written) for job in db.query(models.ExportJob)}
+    assert jobs == {1: ("pending", 0), 2: ("running", 10), 3: ("pending", 0)}
+
+
+def test_export_artifacts_expire_after_ttl(db, quiz, tmp_path):
+    _submit_results(db, quiz, 1)
+    queue = ExportJobQueue(workers=0, max_attempts=2, export_dir=str(tmp_path), ttl_hours=1,
+                           cleanup_interval_seconds=600, lease_seconds=3600)
+    job = queue.create_job(db, "json")
+    queue.enqueue(job.id)
+
+    db.expire_all()
+    job = db.get(models.ExportJob, job.id)
+    assert job.status == "done"
+    assert queue.cleanup_expired() == 0
+    assert queue.cleanup_expired(datetime.now(timezone.utc) + timedelta(hours=2)) == 1
+
+
+def test_export_changes_pages_through_server_generated_updated_at(db, quiz):
+    # updated_at от func.now(): на SQLite - целые секунды, у всех записей одна и та же
+    _submit_results(db, quiz, 4)
+    db.execute(text("UPDATE test_results SET updated_at = datetime('now', '-1 hour')"))
+    db.commit()
+
+    ids, watermark = [], None
+    for _ in range(4):
+        page = services.ExportService.export_changes(db, since=watermark, limit=2)
+        ids += [result["id"] for result in page["results"]]
+        watermark = page["watermark"]
+        if not page["has_more"]:
+            break
+    assert ids == [1, 2, 3, 4]
+
+
+def test_markdown_download_streams_batches(db, quiz, monkeypatch):
+    _submit_results(db, quiz, 5)
+    monkeypatch.setattr(services.ExportService, "STREAM_BATCH_SIZE", 2)
+    monkeypatch.setattr(export_render_pool, "_slots", threading.BoundedSemaphore(1))
+
+    export_rows = services.ExportService.export_rows
+    batches = []
+
+    def record_batch(*args, **kwargs):
+        rows = export_rows(*args, **kwargs)
+        batches.append(len(rows.results))
+        return rows
+
+    monkeypatch.setattr(services.ExportService, "export_rows", record_batch)
+
+    response = TestClient(app).get("/api/results/export/download/markdown")
+    assert response.status_code == 200
+    assert response.headers["x-export-cache"] == "miss"
+    assert "content-length" not in response.headers
+    # Последняя пачка доходит до последнего результата - пустой пачки в конце нет
+    assert batches == [2, 2, 1]
+
+    # Слот освобожден после отправки
+    assert export_render_pool._slots.acquire(blocking=False)
+    export_render_pool._slots.release()
+
+    def without_date(text):
+        return [line for line in text.splitlines() if not line.startswith("**Дата экспорта:**")]
+
+    expected = "".join(services.ExportService.stream_markdown(db))
+    assert without_date(response.text) == without_date(expected)
+    assert response.text.count("## Результат #") == 5
@@ -0,0 +1,50 @@
+import pytest
+
+from app import models
+from app.config import settings
+from app.grading import CompiledQuestion
+
+PUT_PATCH = "PUT remplace complètement une ressource, PATCH met à jour partiellement une ressource"
+NULL_UNDEFINED = ("null est une valeur assignée, undefined est une variable non initialisée, "
+                  "NaN signifie 'Not a Number'")
+GRID_FLEXBOX = "Grid est pour les layouts 2D, Flexbox pour les layouts 1D (ligne ou colonne)"
+
+
+def _question(correct_answer: str) -> CompiledQuestion:
+    return CompiledQuestion(models.Question(question_type="text", correct_answer=correct_answer, points=1))
+
+
+@pytest.fixture
+def fuzzy(monkeypatch):
+    monkeypatch.setattr(settings, "grading_fuzzy_enabled", True)
+
+
+def test_exact_match_ignores_case_and_punctuation():
+    assert _question(PUT_PATCH).grade("  put REMPLACE complètement une ressource - PATCH met à jour "
+                                      "partiellement une ressource!") is True
+
+
+def test_fuzzy_grading_is_off_by_default():
+    assert _question(PUT_PATCH).grade(PUT_PATCH.replace("complètement", "complètment")) is False
+
+
+def test_fuzzy_accepts_typos_in_long_words(fuzzy):
+    assert _question(PUT_PATCH).grade(PUT_PATCH.replace("complètement", "complètment")) is True
+    assert _question("answer number 0").grade("answer numbr 0") is True
+
+
+@pytest.mark.parametrize("reference, answer", [
+    # Перестановка слов меняет смысл ответа
+    (PUT_PATCH, "PATCH remplace complètement une ressource, PUT met à jour partiellement une ressource"),
+    (NULL_UNDEFINED, "undefined est une valeur assignée, null est une variable non initialisée, "
+                     "NaN signifie 'Not a Number'"),
+    (GRID_FLEXBOX, "Grid est pour les layouts 1D, Flexbox pour les layouts 2D (ligne ou colonne)"),
+    # Слова с цифрами сравниваются точно
+    ("HTTP 404 Not Found", "HTTP 403 Not Found"),
+    ("answer number 0", "answer numbr 1"),
+    ("answer number 2", "answer numbr 1"),
+    # Короткие слова сравниваются точно
+    ("PUT", "PAT"),
+])
+def test_fuzzy_rejects_answers_with_another_meaning(fuzzy, reference, answer):
+    assert _question(reference).grade(answer) is False
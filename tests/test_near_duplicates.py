@@ -0,0 +1,63 @@
+from app import models, schemas, services
+from app.config import settings
+from app.analysis import analysis_queue
+from app.profiler import profile_queries
+
+WRONG_ANSWER = "Это способ хранить данные в браузере между перезагрузками страницы без участия сервера"
+REFERENCE = "Архитектурный стиль взаимодействия по HTTP"
+
+
+def _submit(db, quiz, telegram_id: int, answer_text: str) -> models.TestResult:
+    question = db.query(models.Question).filter(models.Question.test_id == quiz.id, models.Question.order == 1).one()
+    submission = schemas.TestSubmission(
+        test_id=quiz.id,
+        answers=[{"question_id": question.id, "answer_text": answer_text, "time_spent": 60}],
+        total_time=600
+    )
+    user_id = services.UserService.get_or_create_user_id(db, telegram_id=telegram_id)
+    result = services.TestResultService.submit_test(db, submission, user_id)
+    analysis_queue.enqueue(result.id)
+    db.expire_all()
+    return db.get(models.TestResult, result.id)
+
+
+def test_near_duplicate_wrong_answers_are_flagged(db, quiz):
+    _submit(db, quiz, 1, WRONG_ANSWER)
+    result = _submit(db, quiz, 2, WRONG_ANSWER.replace("браузере", "браузерe") + ".")
+    assert "near_duplicate_answers" in result.suspicious_reasons
+
+
+def test_exact_matches_are_left_to_identical_answers_check(db, quiz):
+    _submit(db, quiz, 1, WRONG_ANSWER)
+    result = _submit(db, quiz, 2, WRONG_ANSWER.upper())
+    assert result.suspicious_reasons == ["identical_answers"]
+
+
+def test_answers_matching_the_reference_are_not_flagged(db, quiz, monkeypatch):
+    # Верные с опечатками - засчитываются нечеткой проверкой, но не совпадают с эталоном
+    monkeypatch.setattr(settings, "grading_fuzzy_enabled", True)
+    first = _submit(db, quiz, 1, REFERENCE.replace("взаимодействия", "взаимодейстия"))
+    second = _submit(db, quiz, 2, REFERENCE.replace("взаимодействия", "взаимодействя"))
+    assert first.percentage == second.percentage == 100
+    assert "near_duplicate_answers" not in (second.suspicious_reasons or [])
+
+
+def test_catch_up_reads_all_questions_in_one_query(db, quiz):
+    questions = db.query(models.Question).filter(models.Question.test_id == quiz.id).all()
+    user_id = services.UserService.get_or_create_user_id(db, telegram_id=3)
+    for index in range(5):
+        services.TestResultService.submit_test(db, schemas.TestSubmission(
+            test_id=quiz.id,
+            answers=[
+                {"question_id": question.id, "answer_text": f"{WRONG_ANSWER} {index} {question.id}"}
+                for question in questions
+            ]
+        ), user_id)
+
+    question_ids = [question.id for question in questions]
+    with profile_queries("catch up") as profile:
+        caught_up = services.NearDuplicateService._catch_up(db, question_ids, 0)
+    assert caught_up == {question_id: True for question_id in question_ids}
+    # Отметки, ответы всех вопросов, сигнатуры, корзины, новые отметки
+    profile.assert_budget(max_queries=5, max_repeats=1)
+    assert db.query(models.AnswerSignature).count() == 15
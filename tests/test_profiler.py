@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.main import app
+from app.profiler import QueryCounter, fingerprint, profile_queries, track_queries
+
+
+def test_fingerprint_collapses_literals_and_in_lists():
+    assert fingerprint("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'x'") == \
+        "SELECT * FROM users WHERE id IN (?+) AND name = ?"
+
+
+def test_failed_statement_does_not_leak_start_time(db):
+    connection = db.connection()
+    with profile_queries("failed statement") as profile:
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing_table"))
+        db.rollback()
+        db.execute(text("SELECT 1"))
+
+    assert profile.count == 1
+    assert "profiler_query_started" not in db.connection().info
+
+
+def test_nested_blocks_count_the_same_queries(db):
+    with profile_queries("outer") as outer:
+        with track_queries(QueryCounter()) as inner:
+            db.execute(text("SELECT 1"))
+        db.execute(text("SELECT 2"))
+
+    assert inner.count == 1
+    assert outer.count == 2
+
+
+def test_metrics_count_request_queries(db, quiz):
+    client = TestClient(app)
+    client.get(f"/api/tests/{quiz.id}/questions")
+
+    sums = [
+        float(line.rsplit(" ", 1)[1]) for line in client.get("/metrics").text.splitlines()
+        if line.startswith("http_request_db_queries_sum") and "questions" in line
+    ]
+    assert sums and sums[0] >= 1
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+from app.exports import ExportPoolUnavailable, ExportRenderPool
+
+
+def test_broken_pool_is_replaced():
+    pool = ExportRenderPool(workers=1, max_concurrent=1)
+    pool.start()
+    try:
+        # Процесс пула завершается - пул сломан и после перезапуска
+        with pytest.raises(ExportPoolUnavailable):
+            pool.run(os._exit, 1)
+        # Пересозданный пул снова рендерит
+        assert pool.run(len, b"export") == 6
+    finally:
+        pool.stop()
@@ -0,0 +1,29 @@
+from sqlalchemy import text
+
+from app import models, services
+
+
+def _add_results(db, quiz, count: int) -> None:
+    user_id = services.UserService.get_or_create_user_id(db, telegram_id=4001)
+    db.add_all([models.TestResult(user_id=user_id, test_id=quiz.id) for _ in range(count)])
+    db.commit()
+
+
+def _page_ids(db, limit: int):
+    pages, cursor = [], None
+    while True:
+        results, cursor = services.TestResultService.list_results(db, limit=limit, cursor=cursor)
+        pages.append([result.id for result in results])
+        if cursor is None or len(pages) > 10:
+            return pages
+
+
+def test_list_results_pages_through_equal_timestamps(db, quiz):
+    _add_results(db, quiz, 5)
+    # Как у server_default=func.now() на SQLite: секунды без дробной части;
+    # одна запись той же секунды - в формате ORM, с микросекундами
+    db.execute(text("UPDATE test_results SET created_at = '2026-01-01 10:00:00' WHERE id <= 4"))
+    db.execute(text("UPDATE test_results SET created_at = '2026-01-01 10:00:00.500000' WHERE id = 5"))
+    db.commit()
+
+    assert _page_ids(db, limit=2) == [[5, 4], [3, 2], [1]]
@@ -0,0 +1,101 @@
+from fastapi.testclient import TestClient
+
+from app import models, schemas, services
+from app.main import app
+from app.profiler import profile_queries
+from app.ranking import score_ranking
+
+# Запись результата, ответов, задания анализа и трех таблиц статистики
+SUBMIT_QUERIES = 6
+# Плюс загрузка теста и вопросов в кэш проверки
+SUBMIT_QUERIES_COLD = SUBMIT_QUERIES + 2
+
+
+def _submission(db, quiz) -> schemas.TestSubmission:
+    questions = db.query(models.Question).filter(models.Question.test_id == quiz.id).order_by(models.Question.order)
+    return schemas.TestSubmission(
+        test_id=quiz.id,
+        answers=[
+            {"question_id": question.id, "answer_text": question.correct_answer, "time_spent": 10}
+            for question in questions
+        ],
+        total_time=30
+    )
+
+
+def test_submit_query_budget(db, quiz):
+    user_id = services.UserService.get_or_create_user_id(db, telegram_id=1001)
+    submission = _submission(db, quiz)
+
+    with profile_queries("submit_test cold") as profile:
+        result = services.TestResultService.submit_test(db, submission, user_id)
+    profile.assert_budget(max_queries=SUBMIT_QUERIES_COLD, max_repeats=1)
+    assert result.percentage == 100
+
+    with profile_queries("submit_test") as profile:
+        services.TestResultService.submit_test(db, submission, user_id)
+    profile.assert_budget(max_queries=SUBMIT_QUERIES, max_repeats=1)
+
+
+def test_submit_saves_answers_in_one_statement(db, quiz):
+    user_id = services.UserService.get_or_create_user_id(db, telegram_id=1002)
+    submission = _submission(db, quiz)
+    services.TestResultService.submit_test(db, submission, user_id)
+
+    # Число запросов не зависит от числа ответов в отправке
+    submission.answers = submission.answers * 20
+    with profile_queries("submit_test many answers") as profile:
+        result = services.TestResultService.submit_test(db, submission, user_id)
+    profile.assert_budget(max_queries=SUBMIT_QUERIES, max_repeats=1)
+    assert db.query(models.Answer).filter(models.Answer.test_result_id == result.id).count() == 60
+
+
+def test_submit_succeeds_when_percentile_fails(db, quiz, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("ranking unavailable")
+
+    monkeypatch.setattr(score_ranking, "record_result", fail)
+    submission = _submission(db, quiz)
+    response = TestClient(app).post(
+        f"/api/submissions/{quiz.id}/submit",
+        json=submission.model_dump(),
+        headers={"x-telegram-user-id": "1003"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["percentile"] is None
+    assert db.query(models.TestResult).count() == 1
+
+
+def test_bulk_rejects_only_item_with_bad_identity(db, quiz):
+    submission = _submission(db, quiz)
+    items = [
+        schemas.BulkSubmissionItem(telegram_id=1004, submission=submission),
+        # Учетная запись, которую база не примет (NOT NULL)
+        schemas.BulkSubmissionItem.model_construct(
+            telegram_id=None, username=None, first_name=None, last_name=None, submission=submission
+        ),
+        schemas.BulkSubmissionItem(telegram_id=1005, submission=submission),
+    ]
+
+    outcomes = services.TestResultService.submit_bulk(db, items)
+
+    assert [outcome["success"] for outcome in outcomes] == [True, False, True]
+    assert outcomes[1]["error"] == "User error"
+    assert db.query(models.TestResult).count() == 2
+
+
+def test_bulk_succeeds_when_percentile_fails(db, quiz, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("ranking unavailable")
+
+    monkeypatch.setattr(score_ranking, "record_result", fail)
+    submission = _submission(db, quiz).model_dump()
+    response = TestClient(app).post(
+        "/api/submissions/bulk",
+        json={"items": [{"telegram_id": 1006, "submission": submission}]}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 1
+    assert response.json()["results"][0]["percentile"] is None